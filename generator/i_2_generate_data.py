@@ -182,6 +182,9 @@ for _ in range(NUM_PRODUCTS):
     product_ids.append(product["product_id"])
 logger.info(f"Generated {len(products)} products")
 
+# Index products by id so purchase amounts are a lookup per item instead of a catalog scan
+product_prices = {p["product_id"]: p["price"] for p in products}
+
 # Write products to CSV
 with open("products.csv", "w", newline='') as f:
     fieldnames = list(product_field_types.keys())
@@ -248,7 +251,7 @@ def generate_event_data(event_name, user_id):
             items = [random.choice(products)["product_id"] for _ in range(random.randint(1, 3))]
             event.update({
                 "quantity": len(items),
-                "amount": round(sum(p["price"] for p in products if p["product_id"] in items), 2),
+                "amount": round(sum(product_prices[product_id] for product_id in items), 2),
                 "items": ";".join(items)
             })
 
@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import mock_server
+import scale
+
+# Times every stage of main.py against the local mock CDP at several dataset sizes, each in a fresh
+# working directory, and reports seconds, rows/s and peak RSS per stage:
+#   python benchmark.py --sizes 1000,10000,70000 --latency 0.002 --error-rate 0.01 --output bench.json
+#   python benchmark.py --scale-factors 0.1,1,10 --output bench.json
+# Settings from the environment (CDP_SEND_WORKERS, CDP_DATA_FORMAT, ...) and --profile apply to every stage;
+# --sizes overrides the profile's NUM_CUSTOMERS and NUM_EVENTS; --scale-factors sets SCALE_FACTOR, which wins
+# over the profile's NUM_* (see scale.py), and drops any CDP_NUM_* from the environment.
+# Row counts and dataset bytes come from the dataset_manifest.json written by the generate stage.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# (stage, scripts, what the rows/s figure counts)
+STAGES = [
+    ("create_tenant", ["i_1_create_tenant.py"], None),
+    ("generate", ["i_2_1_generate_products.py", "i_2_2_generate_customers.py", "i_2_3_generate_events.py"], "rows"),
+    ("register_schema", ["i_3_register_schema.py"], None),
+    ("validate_schema", ["i_4_validate_schema.py"], None),
+    ("send_customers", ["i_5_send_customers.py"], "customers"),
+    ("send_events", ["i_6_send_events.py"], "events"),
+]
+
+
+def peak_rss_mb(rusage):
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return rusage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_script(script, workdir, env):
+    with open(os.path.join(workdir, "benchmark.log"), "ab") as log:
+        process = subprocess.Popen([sys.executable, os.path.join(HERE, script)], cwd=workdir, env=env,
+                                   stdout=log, stderr=log)
+        # wait4 returns the resource usage of this child alone
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"{script} exited with {process.returncode}, see {workdir}/benchmark.log")
+    return rusage
+
+
+def run_pipeline(base_url, size, sizing, keep):
+    # sizing holds the CDP_* variables that set this run's dataset size; None removes a variable
+    workdir = tempfile.mkdtemp(prefix=f"cdp-bench-{size}-")
+    env = {name: value for name, value in {**os.environ, **sizing}.items() if value is not None}
+    env.update({"CDP_BASE_URL": base_url, "CDP_GENERATION_SEED": os.getenv("CDP_GENERATION_SEED", "0")})
+    rows = {}
+    dataset_bytes = None
+    results = []
+    try:
+        for stage, scripts, counted in STAGES:
+            start = time.perf_counter()
+            peak = max(peak_rss_mb(run_script(script, workdir, env)) for script in scripts)
+            elapsed = time.perf_counter() - start
+            if stage == "generate":
+                with open(os.path.join(workdir, "dataset_manifest.json"), "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+                counts = manifest["counts"]
+                rows = {"rows": counts["customers"] + counts["events"], "customers": counts["customers"],
+                        "events": counts["events"]}
+                dataset_bytes = manifest["total_bytes"]
+            count = rows.get(counted)
+            results.append({"size": size, "stage": stage, "seconds": round(elapsed, 3), "rows": count,
+                            "rows_per_second": round(count / elapsed, 1) if count else None,
+                            "dataset_bytes": dataset_bytes, "peak_rss_mb": round(peak, 1)})
+            print_result(results[-1])
+    finally:
+        if keep:
+            print(f"Kept working directory {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def print_result(result):
+    rate = f"{result['rows_per_second']:>12.1f}" if result["rows_per_second"] else f"{'-':>12}"
+    print(f"{result['size']:>9} {result['stage']:<16} {result['seconds']:>9.3f}s {rate} rows/s "
+          f"{result['peak_rss_mb']:>8.1f} MB")
+
+
+def main():
+    parser = mock_server.build_parser()
+    parser.description = "Benchmark the pipeline stages against a local mock CDP"
+    parser.set_defaults(port=0)
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated event counts")
+    parser.add_argument("--scale-factors", help="comma-separated scale factors, used instead of --sizes")
+    parser.add_argument("--customers-per-event", type=float, default=1 / scale.EVENTS_PER_CUSTOMER,
+                        help="customers generated per event (default matches the scale factor's ratio)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--keep", action="store_true", help="keep each size's working directory")
+    parser.add_argument("--profile", help="workload profile for every stage, by name in profiles/ or path")
+    options = parser.parse_args()
+    if options.profile:
+        os.environ["CDP_PROFILE"] = options.profile
+
+    server = mock_server.make_server(options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://{options.host}:{server.server_address[1]}"
+    print(f"Mock CDP on {base_url} (latency {options.latency}s, error rate {options.error_rate})")
+    print(f"{'size':>9} {'stage':<16} {'time':>10} {'throughput':>19} {'peak RSS':>11}")
+
+    results = []
+    if options.scale_factors:
+        for factor in options.scale_factors.split(","):
+            sizing = {"CDP_SCALE_FACTOR": factor, "CDP_NUM_PRODUCTS": None, "CDP_NUM_CUSTOMERS": None,
+                      "CDP_NUM_EVENTS": None}
+            results += run_pipeline(base_url, factor, sizing, options.keep)
+    else:
+        for events in (int(size) for size in options.sizes.split(",")):
+            customers = max(1, round(events * options.customers_per_event))
+            sizing = {"CDP_NUM_CUSTOMERS": str(customers), "CDP_NUM_EVENTS": str(events)}
+            results += run_pipeline(base_url, events, sizing, options.keep)
+    server.shutdown()
+
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as f:
+            json.dump({"options": vars(options), "received": dict(mock_server.received), "results": results}, f, indent=2)
+        print(f"Wrote {options.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import config
+from utils import DATE_RANGE, null_rate, BIGINT_RANGES, DEFAULT_BIGINT_RANGE
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; generators fall back to the per-row Python backend
+    np = None
+
+logger = config.logger
+
+VECTOR_TYPES = {"bigint", "double", "boolean", "date", "datetime"}
+
+# "auto" uses numpy when it is installed; asking for "numpy" without it warns once, here, rather than per shard
+if config.GENERATION_BACKEND == "numpy" and np is None:
+    logger.warning("numpy is not installed, falling back to the python generation backend")
+NUMPY_ENABLED = np is not None and config.GENERATION_BACKEND in ("auto", "numpy")
+
+
+def numpy_enabled():
+    return NUMPY_ENABLED
+
+
+def is_vectorizable(field, choices):
+    return field["type"] in VECTOR_TYPES or field["name"] in choices
+
+
+def generate_column(field, count, rng, choices):
+    name = field["name"]
+    field_type = field["type"]
+    if field_type == "bigint":
+        low, high = BIGINT_RANGES.get(name, DEFAULT_BIGINT_RANGE)
+        values = rng.integers(low, high + 1, count)
+    elif field_type == "double":
+        values = np.round(rng.uniform(10, 500, count), 2)
+    elif field_type == "boolean":
+        values = rng.random(count) < 0.5
+    elif field_type in ["date", "datetime"]:
+        start, end = (int(bound * 1_000_000) for bound in DATE_RANGE)
+        micros = rng.integers(start, max(end, start + 1), count).astype("datetime64[us]")
+        values = np.char.add(np.datetime_as_string(micros, unit="us"), "Z")
+    elif name in choices:
+        options = np.array(choices[name], dtype=object)
+        values = options[rng.integers(0, len(options), count)]
+    else:
+        raise ValueError(f"Field {name} of type {field_type} cannot be generated as a column")
+
+    values = values.tolist()
+    if field["nullable"]:
+        for i in np.flatnonzero(rng.random(count) < null_rate(name)).tolist():
+            values[i] = None
+    return values
+
+
+class ColumnBuffer:
+    """Hands out values one at a time from columns generated in bulk, refilling a column when it runs out."""
+
+    def __init__(self, fields, seed, choices=None, chunk_size=None):
+        self.choices = choices or {}
+        self.fields = {f["name"]: f for f in fields if is_vectorizable(f, self.choices)}
+        self.chunk_size = chunk_size or config.GENERATION_COLUMN_CHUNK
+        self.rng = np.random.default_rng(seed)
+        self._columns = {}
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def take(self, name):
+        column = self._columns.get(name)
+        if column is not None:
+            value = next(column, self)
+            if value is not self:
+                return value
+        column = iter(generate_column(self.fields[name], self.chunk_size, self.rng, self.choices))
+        self._columns[name] = column
+        return next(column)
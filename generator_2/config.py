@@ -1,15 +1,189 @@
+import atexit
+import itertools
 import logging
+import logging.handlers
+import multiprocessing
+import queue
 import coloredlogs
 import json
 import os
+import scale
+
+try:
+    import yaml
+except ImportError:  # PyYAML is optional; JSON profiles need nothing extra
+    yaml = None
+
+# Workload profile: a JSON or YAML file whose "settings" map setting names (without the CDP_ prefix) to
+# defaults for the variables below, e.g. CDP_PROFILE=black-friday or CDP_PROFILE=path/to/profile.yaml.
+# Names without a path are looked up in profiles/. Variables set in the environment still win.
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+PROFILE = os.getenv("CDP_PROFILE", "")
+# Settings that describe a workload (mix, cardinality, volume); endpoints, credentials, file locations,
+# logging and how the senders talk to the service (batching, workers, retries) stay per machine
+PROFILE_SETTINGS_ALLOWED = frozenset({
+    "SCALE_FACTOR", "NUM_PRODUCTS", "NUM_CUSTOMERS", "NUM_EVENTS",
+    "DATA_FORMAT", "GENERATION_SEED", "GENERATION_SHARD_SIZE", "GENERATION_BACKEND", "GENERATION_COLUMN_CHUNK",
+    "GENERATION_REFERENCE_DATE", "VALUE_POOLS", "VALUE_POOL_SIZE", "VALUE_POOL_SEED",
+    "NULL_RATE", "NULL_RATES", "BIGINT_RANGES",
+    "CUSTOMER_DISTRIBUTION", "PRODUCT_DISTRIBUTION", "EVENT_TYPE_DISTRIBUTION",
+    "EVENT_MODE", "SESSION_DAYS", "SESSION_MEAN_GAP", "SESSION_PEAK_HOUR", "SESSION_DIURNAL_AMPLITUDE",
+    "SEND_RATE", "SEND_BURST", "SEND_RATE_PROFILE",
+})
+
+
+def find_profile(name):
+    if os.path.exists(name):
+        return name
+    for ext in (".json", ".yaml", ".yml"):
+        path = os.path.join(PROFILE_DIR, name + ext)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"Workload profile {name} not found in {PROFILE_DIR}")
+
+
+def load_profile(name):
+    path = find_profile(name)
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise ImportError(f"PyYAML is needed to read {path}; install it or use a JSON profile")
+            profile = yaml.safe_load(f)
+        else:
+            profile = json.load(f)
+    if not isinstance(profile, dict):  # an empty YAML file loads as None
+        raise ValueError(f"Workload profile {path} must be a mapping with \"description\" and \"settings\"")
+    return profile.get("description", ""), profile.get("settings") or {}
+
+
+def profile_value(name, value):
+    # Environment strings for profile values; name -> weight maps for *_DISTRIBUTION become histogram specs
+    if isinstance(value, bool):
+        return str(value).lower()
+    if name.endswith("_DISTRIBUTION") and isinstance(value, dict):
+        return "histogram:" + ",".join(f"{k}={v}" for k, v in value.items())
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def setting(name, default=None):
+    # CDP_<name> from the environment, else the workload profile's value, else default
+    value = os.environ.get(f"CDP_{name}")
+    if value is None and name in PROFILE_SETTINGS:
+        value = profile_value(name, PROFILE_SETTINGS[name])
+    return default if value is None else value
+
+
+PROFILE_DESCRIPTION, PROFILE_SETTINGS = load_profile(PROFILE) if PROFILE else ("", {})
+_unknown = set(PROFILE_SETTINGS) - PROFILE_SETTINGS_ALLOWED
+if _unknown:
+    raise ValueError(f"Unknown settings in workload profile {PROFILE}: {sorted(_unknown)}")
+_sized = {"NUM_PRODUCTS", "NUM_CUSTOMERS", "NUM_EVENTS"} & set(PROFILE_SETTINGS)
+if "SCALE_FACTOR" in PROFILE_SETTINGS and _sized:
+    raise ValueError(f"Workload profile {PROFILE} sets both SCALE_FACTOR and {sorted(_sized)}; keep one")
 
 # Placeholder for existing config
 BASE_URL_1 = os.getenv("CDP_BASE_URL", "http://10.0.10.140:30100")
 BASE_URL_2 = os.getenv("CDP_BASE_URL", "http://10.0.10.140:30101")
 AUTH_TOKEN = None  # or os.getenv("CDP_AUTH_TOKEN")
-DELAY_BETWEEN_REQUESTS = 0.1  # Update with actual value
+
+# Schema registration
+SCHEMA_REGISTER_WORKERS = int(os.getenv("CDP_SCHEMA_REGISTER_WORKERS", "16"))  # draft fields posted concurrently
+
+# Tenant schema cache (see schema_cache.py)
+SCHEMA_CACHE = os.getenv("CDP_SCHEMA_CACHE", "tenant_schema_cache.json")  # empty disables caching
+SCHEMA_CACHE_TTL = float(os.getenv("CDP_SCHEMA_CACHE_TTL", "600"))  # seconds before revalidating
+SCHEMA_OFFLINE = os.getenv("CDP_SCHEMA_OFFLINE", "0") == "1"  # use the cache only, never the API
+
+# Ingestion engine
+SEND_WORKERS = int(os.getenv("CDP_SEND_WORKERS", "16"))
+SEND_MAX_IN_FLIGHT = int(os.getenv("CDP_SEND_MAX_IN_FLIGHT", "64"))
+SEND_PROCESSES = int(os.getenv("CDP_SEND_PROCESSES", "1"))  # >1 splits the event file into row ranges, each process runs SEND_WORKERS threads
+
+# Retries and dead letters for failed ingest requests (see ingest.post_with_retry, dead_letter.py)
+SEND_RETRY_ATTEMPTS = int(os.getenv("CDP_SEND_RETRY_ATTEMPTS", "5"))  # attempts per request, 1 = no retries
+SEND_RETRY_BASE_DELAY = float(os.getenv("CDP_SEND_RETRY_BASE_DELAY", "0.2"))  # seconds, doubled per retry
+SEND_RETRY_MAX_DELAY = float(os.getenv("CDP_SEND_RETRY_MAX_DELAY", "10"))
+SEND_RETRY_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}  # plus connection errors
+SEND_DEAD_LETTER = os.getenv("CDP_SEND_DEAD_LETTER", "dead_letters.ndjson")  # empty disables
+
+# Live send metrics (see metrics.py)
+METRICS_INTERVAL = float(os.getenv("CDP_METRICS_INTERVAL", "10"))  # seconds between progress lines, 0 disables
+METRICS_HOST = os.getenv("CDP_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("CDP_METRICS_PORT", "0"))  # serve Prometheus-style /metrics on this port, 0 disables
+
+# Send journal: acknowledged rows per tenant and dataset, used by --resume (see send_journal.py)
+SEND_JOURNAL = os.getenv("CDP_SEND_JOURNAL", "send_journal.sqlite")  # empty disables journaling
+
+# Asyncio customer loader
+CUSTOMER_SEND_MODE = os.getenv("CDP_CUSTOMER_SEND_MODE", "async")  # "async" or "serial"
+SEND_CONCURRENCY = int(os.getenv("CDP_SEND_CONCURRENCY", "8"))  # keep-alive connections
+SEND_QUEUE_SIZE = int(os.getenv("CDP_SEND_QUEUE_SIZE", "1000"))
+SEND_BACKOFF_STATUS_CODES = {429, 502, 503, 504}
+SEND_BACKOFF_SECONDS = float(os.getenv("CDP_SEND_BACKOFF_SECONDS", "1.0"))
+
+# Rate control shared by both senders (see rate_limiter.py)
+SEND_RATE = float(setting("SEND_RATE", "0"))  # target records/s, 0 = unlimited
+SEND_BURST = float(setting("SEND_BURST", "1"))
+SEND_RATE_PROFILE = setting("SEND_RATE_PROFILE", "")  # e.g. "ramp:10:500:60", "step:50:50:30", "spike:50:1000:30:10"
+
+# Batch ingestion: N records per request as a JSON array or NDJSON body
+SEND_BATCH_SIZE = int(os.getenv("CDP_SEND_BATCH_SIZE", "1"))  # 1 = one record per request
+SEND_BATCH_LINGER = float(os.getenv("CDP_SEND_BATCH_LINGER", "0.05"))  # max seconds a partial batch waits
+SEND_BATCH_FORMAT = os.getenv("CDP_SEND_BATCH_FORMAT", "json")  # "json" (array) or "ndjson"
+SEND_BATCH_SPLIT_STATUS_CODES = {400, 413, 422}  # rejected batches are split in half and resent
+
+# Dataset size (see scale.py): a scale factor derives NUM_* and the primary_id range. It wins over the
+# profile's sizes, so one profile can be run at several factors; CDP_NUM_* in the environment still win.
+SCALE_FACTOR = float(setting("SCALE_FACTOR", "0"))  # 0 = use the NUM_* settings as given
+SCALED_SIZES = scale.scaled_sizes(SCALE_FACTOR) if SCALE_FACTOR else {}
+
+
+def sized_setting(name, default):
+    if f"CDP_{name}" in os.environ:
+        return os.environ[f"CDP_{name}"]
+    return SCALED_SIZES.get(name) or setting(name, default)
+
+
+# Data generation (see sharding.py)
+NUM_PRODUCTS = int(sized_setting("NUM_PRODUCTS", "500"))
+NUM_CUSTOMERS = int(sized_setting("NUM_CUSTOMERS", "30000"))
+NUM_EVENTS = int(sized_setting("NUM_EVENTS", "70000"))
+DATA_FORMAT = setting("DATA_FORMAT", "csv")  # "csv" or "records" (typed binary stream, see records.py)
+GENERATION_SEED = int(setting("GENERATION_SEED")) if setting("GENERATION_SEED") else None
+GENERATION_PROCESSES = int(os.getenv("CDP_GENERATION_PROCESSES", str(os.cpu_count() or 1)))
+GENERATION_SHARD_SIZE = int(setting("GENERATION_SHARD_SIZE", "10000"))
+GENERATION_MERGE_PARTS = os.getenv("CDP_GENERATION_MERGE_PARTS", "true").lower() == "true"
+GENERATION_BACKEND = setting("GENERATION_BACKEND", "auto")  # "auto" (numpy when installed), "numpy" (columnar, optional dependency) or "python"
+GENERATION_COLUMN_CHUNK = int(setting("GENERATION_COLUMN_CHUNK", "10000"))
+VALUE_POOLS_ENABLED = setting("VALUE_POOLS", "true").lower() == "true"
+VALUE_POOL_SIZE = int(setting("VALUE_POOL_SIZE", "5000"))
+VALUE_POOL_SEED = int(setting("VALUE_POOL_SEED", "0"))
+VALUE_POOL_DIR = os.getenv("CDP_VALUE_POOL_DIR", ".value_pools")  # empty to keep pools in memory only
+GENERATION_REFERENCE_DATE = setting("GENERATION_REFERENCE_DATE")  # YYYY-MM-DD, generated dates fall in its year up to that day; defaults to today
+NULL_RATE = float(setting("NULL_RATE", "0.2"))  # share of nulls in nullable fields
+NULL_RATES = json.loads(setting("NULL_RATES", "{}"))  # per-field overrides, e.g. {"device_type": 0.5}
+BIGINT_RANGES = json.loads(setting("BIGINT_RANGES", "{}"))  # inclusive range overrides, e.g. {"quantity": [1, 3]}
+if SCALED_SIZES and "primary_id" not in json.loads(os.getenv("CDP_BIGINT_RANGES", "{}")):
+    BIGINT_RANGES["primary_id"] = SCALED_SIZES["PRIMARY_ID_RANGE"]
+
+# Popularity skew (see sampling.py): "uniform", "zipf[:exponent]" or "histogram:w1,w2,..." over equal rank
+# buckets; event types also take "histogram:page_view=5,search=2,...". Sessions mode picks event types by flow.
+CUSTOMER_DISTRIBUTION = setting("CUSTOMER_DISTRIBUTION", "uniform")
+PRODUCT_DISTRIBUTION = setting("PRODUCT_DISTRIBUTION", "uniform")
+EVENT_TYPE_DISTRIBUTION = setting("EVENT_TYPE_DISTRIBUTION", "uniform")
+
+# Event timeline (see sessions.py)
+EVENT_MODE = setting("EVENT_MODE", "uniform")  # "uniform" (independent events) or "sessions" (time-ordered clickstreams)
+SESSION_DAYS = float(setting("SESSION_DAYS", "1"))  # simulated days, ending at the reference date
+SESSION_MEAN_GAP = float(setting("SESSION_MEAN_GAP", "30"))  # mean seconds between a session's events
+SESSION_PEAK_HOUR = float(setting("SESSION_PEAK_HOUR", "20"))  # UTC hour with the most session starts
+SESSION_DIURNAL_AMPLITUDE = float(setting("SESSION_DIURNAL_AMPLITUDE", "0.6"))  # 0 = flat, 1 = no sessions at the trough
 
 # Logging configuration
+LOG_ASYNC = os.getenv("CDP_LOG_ASYNC", "true").lower() == "true"  # format and write log records on a background thread
+LOG_SUCCESS_SAMPLE = int(os.getenv("CDP_LOG_SUCCESS_SAMPLE", "1"))  # log 1 in N successful requests (0 = none); failures are always logged
 LOG_DIR = "logs"
 if not os.path.exists(LOG_DIR):
     os.makedirs(LOG_DIR)
@@ -49,6 +223,67 @@ curl_logger.addHandler(curl_handler)
 curl_logger.propagate = False
 
 
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queues records unformatted, so message formatting also happens on the listener thread."""
+
+    def prepare(self, record):
+        return record
+
+
+_listeners = []
+
+
+def start_async_logging(*targets):
+    # Moves each logger's handlers behind a queue drained by a QueueListener thread
+    for target in targets:
+        handlers = target.handlers[:]
+        log_queue = queue.SimpleQueue()
+        for handler in handlers:
+            target.removeHandler(handler)
+        target.addHandler(DeferredQueueHandler(log_queue))
+        listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _listeners.append((target, handlers, listener))
+
+
+def _restore_handlers():
+    listeners = []
+    while _listeners:
+        target, handlers, listener = _listeners.pop()
+        for handler in target.handlers[:]:
+            target.removeHandler(handler)
+        for handler in handlers:
+            target.addHandler(handler)
+        listeners.append(listener)
+    return listeners
+
+
+def stop_async_logging():
+    # Puts the handlers back and flushes whatever is still queued
+    for listener in _restore_handlers():
+        listener.stop()
+
+
+if PROFILE and multiprocessing.parent_process() is None:
+    logger.info(f"Using workload profile {PROFILE}: {PROFILE_DESCRIPTION}")
+
+# Only the main process logs asynchronously: pool workers exit without running atexit hooks,
+# and a forked worker has no listener thread, so it goes back to writing directly.
+if LOG_ASYNC and multiprocessing.parent_process() is None:
+    start_async_logging(logger, curl_logger)
+    atexit.register(stop_async_logging)
+    os.register_at_fork(after_in_child=_restore_handlers)
+
+_success_count = itertools.count()
+
+
+def sample_success():
+    # True for 1 in LOG_SUCCESS_SAMPLE calls
+    if LOG_SUCCESS_SAMPLE <= 1:
+        return LOG_SUCCESS_SAMPLE == 1
+    return next(_success_count) % LOG_SUCCESS_SAMPLE == 0
+
+
 def curl_from_request(method: str, url: str, headers: dict = None, data=None):
     parts = [f"curl -X {method.upper()} '{url}'"]
     if headers:
@@ -60,11 +295,30 @@ def curl_from_request(method: str, url: str, headers: dict = None, data=None):
     return " ".join(parts)
 
 
-def handle_curl_debug(method, url, headers, data, response=None):
-    curl = curl_from_request(method, url, headers, data)
-    curl_logger.debug(curl)
-    if response and not response.ok:
-        logger.error(f"Failed request [{response.status_code}]: {response.text}\n{curl}")
+class CurlCommand:
+    """Builds the curl string only when a handler actually formats the record."""
+
+    __slots__ = ("method", "url", "headers", "data")
+
+    def __init__(self, method, url, headers, data):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.data = data
+
+    def __str__(self):
+        return curl_from_request(self.method, self.url, self.headers, self.data)
+
+
+def handle_curl_debug(method, url, headers, data, response=None, sampled=None):
+    # Failures are always logged, successes 1 in LOG_SUCCESS_SAMPLE unless the caller already sampled
+    failed = response is None or not response.ok
+    if not failed and not (sample_success() if sampled is None else sampled):
+        return
+    curl = CurlCommand(method, url, headers, data)
+    curl_logger.debug("%s", curl)
+    if response is not None and not response.ok:
+        logger.error("Failed request [%s]: %s\n%s", response.status_code, response.text, curl)
 
 
 # Example usage
@@ -0,0 +1,42 @@
+import json
+import os
+import threading
+import time
+import config
+
+logger = config.logger
+
+# Records the ingest service still rejected after retries, one JSON object per line:
+#   {"time", "url", "label", "status", "error", "record"}
+# Replay them with replay_dead_letters.py. A journaled send acknowledges dead-lettered rows, so the file
+# owns them from then on and --resume does not send them a second time.
+_lock = threading.Lock()
+
+
+def write_dead_letters(url, label, records, status=None, error=None, path=None):
+    # Returns whether the records were written, i.e. whether dead-lettering is enabled
+    path = config.SEND_DEAD_LETTER if path is None else path
+    if not path:
+        return False
+    now = time.time()
+    lines = "".join(
+        json.dumps({"time": now, "url": url, "label": label, "status": status,
+                    "error": str(error) if error else None, "record": record}, ensure_ascii=False) + "\n"
+        for record in records
+    )
+    # One append per call keeps lines whole when several sending processes share the file
+    with _lock:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, lines.encode("utf-8"))
+        finally:
+            os.close(fd)
+    logger.warning(f"Wrote {len(records)} failed {label}s to {path}")
+    return True
+
+
+def read_dead_letters(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
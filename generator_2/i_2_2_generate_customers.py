@@ -1,81 +1,104 @@
 import json
 import random
-from datetime import timezone
-from faker import Faker
-from utils import logger, get_tenant_schema, write_csv_with_types, config
+from functools import partial
+from utils import logger, get_tenant_schema, write_dataset, data_path, config, BIGINT_RANGES
+from sharding import run_shards, part_path, clear_outputs, merge_parts, seed_generators, derive_seed
+from ids import IdPermutation
+from value_pools import pooled
+from schema_plan import compile_customer_plan
+from columnar import np, numpy_enabled, is_vectorizable, generate_column
 
-fake = Faker()
-NUM_CUSTOMERS = 30000
+NUM_CUSTOMERS = config.NUM_CUSTOMERS
+DATA_PATH = data_path("customers")
+# Varchar fields the columnar backend draws from a fixed list
+CUSTOMER_CHOICES = {"gender": ["Male", "Female", "Other"]}
 
-with open("tenant.json", "r", encoding="utf-8") as f:
-    tenant_id = json.load(f)["tenant_id"]
-logger.info(f"Loaded tenant_id: {tenant_id}")
+# Set by main() in the parent and by init_worker() in generation processes
+customer_fields = []
 
-customer_fields, _, _ = get_tenant_schema(config.BASE_URL_1, tenant_id)
-logger.info("Fetched tenant schema")
+# Varchar fields with their own value source; everything else is generated by type in schema_plan
+NAMED_PRODUCERS = {
+    ("varchar", "first_name"): partial(pooled, "first_name"),
+    ("varchar", "last_name"): partial(pooled, "last_name"),
+    ("varchar", "gender"): partial(random.choice, CUSTOMER_CHOICES["gender"]),
+}
 
-def generate_field_value(field, event_type=None):
-    field_type = field["type"]
-    nullable = field["nullable"]
-    size = field["size"]
+def primary_ids():
+    # Row numbers map to distinct ids through one permutation for the whole run, so shards never collide
+    return IdPermutation(*BIGINT_RANGES["primary_id"], derive_seed("primary_id", 0))
 
-    if nullable and random.random() < 0.2:
-        return None
+def generate_customers(count, first_row):
+    ids = iter(primary_ids().block(first_row, count))
+    plan = compile_customer_plan(customer_fields, {**NAMED_PRODUCERS, ("bigint", "primary_id"): ids.__next__})
+    for _ in range(count):
+        yield {name: produce() for name, produce in plan}
 
-    if field_type == "bigint":
-        if field["name"] == "primary_id":
-            return random.randint(100000, 999999)
-        elif field["name"] == "offset" or field["name"] == "partition_id":
-            return random.randint(0, 1000)
-        elif field["name"] == "quantity":
-            return random.randint(1, 10)
-        return random.randint(0, 10000)
+def generate_customers_columnar(count, seed, first_row):
+    rng = np.random.default_rng(seed)
+    ids = primary_ids()
+    plan = compile_customer_plan(customer_fields, NAMED_PRODUCERS)
+    fields = {f["name"]: f for f in customer_fields}
+    names = [name for name, _ in plan]
+    for start in range(0, count, config.GENERATION_COLUMN_CHUNK):
+        size = min(config.GENERATION_COLUMN_CHUNK, count - start)
+        columns = [ids.block(first_row + start, size) if name == "primary_id"
+                   else generate_column(fields[name], size, rng, CUSTOMER_CHOICES)
+                   if is_vectorizable(fields[name], CUSTOMER_CHOICES) else [produce() for _ in range(size)]
+                   for name, produce in plan]
+        for values in zip(*columns):
+            yield dict(zip(names, values))
 
-    elif field_type == "varchar":
-        if field["name"] == "first_name":
-            return fake.first_name()
-        elif field["name"] == "last_name":
-            return fake.last_name()
-        elif field["name"] == "gender":
-            return random.choice(["Male", "Female", "Other"])
-        return fake.word()[:size] if size else fake.word()
+def collect_ids(customers, customer_ids):
+    for customer in customers:
+        if "primary_id" in customer:
+            customer_ids.append(customer["primary_id"])
+        yield customer
 
-    elif field_type in ["date", "datetime"]:
-        return fake.date_time_this_year(tzinfo=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+def init_worker(fields):
+    global customer_fields
+    customer_fields = fields
 
-    elif field_type == "double":
-        return round(random.uniform(10, 500), 2)
+def generate_shard(shard_index, count, seed):
+    seed_generators(seed)
+    customer_ids = []
+    fieldnames = [f["name"] for f in customer_fields if f["name"] != "created_at"]
+    first_row = shard_index * config.GENERATION_SHARD_SIZE
+    customers = (generate_customers_columnar(count, seed, first_row) if numpy_enabled()
+                 else generate_customers(count, first_row))
+    write_dataset(collect_ids(customers, customer_ids), part_path(DATA_PATH, shard_index), fieldnames)
+    return customer_ids
 
-    elif field_type == "boolean":
-        return random.choice([True, False])
+def main(tenant_id=None):
+    # Returns the customer_data.json contents for the pipeline runner (main.py)
+    if tenant_id is None:
+        with open("tenant.json", "r", encoding="utf-8") as f:
+            tenant_id = json.load(f)["tenant_id"]
+        logger.info(f"Loaded tenant_id: {tenant_id}")
 
-    raise ValueError(f"Unknown field type: {field_type}")
+    fields, _, _ = get_tenant_schema(config.BASE_URL_1, tenant_id)
+    logger.info("Fetched tenant schema")
+    low, high = BIGINT_RANGES["primary_id"]
+    if NUM_CUSTOMERS > high - low + 1:
+        raise ValueError(f"{NUM_CUSTOMERS} customers do not fit in the primary_id range {low}..{high}")
 
-customers = []
-customer_ids = []
-customer_field_types = {}
+    clear_outputs(DATA_PATH)
+    shard_ids = run_shards(generate_shard, NUM_CUSTOMERS, "customers", initializer=init_worker, initargs=(fields,))
+    customer_ids = [customer_id for ids in shard_ids for customer_id in ids]
+    logger.info(f"Generated {NUM_CUSTOMERS} customers")
+    if config.GENERATION_MERGE_PARTS:
+        merge_parts(DATA_PATH, len(shard_ids))
 
-logger.info(f"Generating {NUM_CUSTOMERS} customers")
-for _ in range(NUM_CUSTOMERS):
-    customer = {}
-    for field in customer_fields:
-        if field["name"] == "created_at" and field["flags"]["tableBuildIn"]:
-            continue
-        customer[field["name"]] = generate_field_value(field)
-    customers.append(customer)
-    if "primary_id" in customer:
-        customer_ids.append(customer["primary_id"])
-    if not customer_field_types:
-        for field in customer_fields:
-            customer_field_types[field["name"]] = field["type"].replace("boolean", "BOOL").replace("bigint", "BIGINT").replace(
-                "double", "DOUBLE").replace("varchar", "VARCHAR_1000").replace("date", "DATETIME").replace("datetime", "DATETIME")
-logger.info(f"Generated {len(customers)} customers")
+    customer_field_types = {}
+    for field in fields:
+        customer_field_types[field["name"]] = field["type"].replace("boolean", "BOOL").replace("bigint", "BIGINT").replace(
+            "double", "DOUBLE").replace("varchar", "VARCHAR_1000").replace("date", "DATETIME").replace("datetime", "DATETIME")
 
-with open("customers.csv", "w", newline='') as f:
-    fieldnames = [f["name"] for f in customer_fields if f["name"] != "created_at"]
-    write_csv_with_types(customers, "customers.csv", fieldnames)
+    # Save customer IDs and field types for other scripts
+    customer_data = {"customer_ids": customer_ids, "customer_field_types": customer_field_types}
+    with open("customer_data.json", "w", encoding="utf-8") as f:
+        json.dump(customer_data, f, indent=2)
+    logger.info("Completed writing to customer_data.json")
+    return customer_data
 
-# Save customer IDs and field types for other scripts
-with open("customer_data.json", "w", encoding="utf-8") as f:
-    json.dump({"customer_ids": customer_ids, "customer_field_types": customer_field_types}, f, indent=2)
-logger.info("Completed writing to customer_data.json")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -1,120 +1,89 @@
-import uuid
+import os
 import random
 import json
 import csv
-from datetime import datetime, timezone
-from collections import defaultdict
-from utils import (logger, fake, config, get_tenant_schema, write_csv_with_types, infer_dtype,
-                  EVENT_TYPES, DEVICE_TYPES, PLATFORMS, CURRENCIES, PAYMENT_METHODS,
+from functools import partial
+from itertools import accumulate
+from collections import Counter, defaultdict
+from utils import (logger, config, get_tenant_schema, write_dataset, data_path, infer_dtype,
+                  random_uuid, DATE_RANGE, EVENT_TYPES, DEVICE_TYPES, PLATFORMS, CURRENCIES, PAYMENT_METHODS,
                   PRODUCT_BRANDS, PRODUCT_CATEGORIES, PRODUCT_COLORS, PRODUCT_SIZES, PRODUCT_TYPES,
-                  EVENT_FIELD_RULES)
-
-NUM_EVENTS = 70000
-
-with open("tenant.json", "r", encoding="utf-8") as f:
-    tenant_id = json.load(f)["tenant_id"]
-logger.info(f"Loaded tenant_id: {tenant_id}")
-
-with open("product_data.json", "r", encoding="utf-8") as f:
-    product_data = json.load(f)
-
-# Read all rows from the products.csv file
-with open("products.csv", "r", encoding="utf-8") as csvfile:
-    reader = csv.DictReader(csvfile)
-    products = [row for row in reader]  # Create a list of all rows
-
-# Ensure that each product has the correct product_id from product_data
-products = [{**product, "product_id": pid} for product, pid in zip(products, product_data["product_ids"])]
-
-product_ids = product_data["product_ids"]
-
-
-with open("customer_data.json", "r", encoding="utf-8") as f:
-    customer_data = json.load(f)
-    customer_ids = customer_data["customer_ids"]
-
-_, event_fields, _ = get_tenant_schema(config.BASE_URL_1, tenant_id)
-logger.info("Fetched tenant schema")
-
-def generate_field_value(field, event_type=None):
-    field_type = field["type"]
-    nullable = field["nullable"]
-    size = field["size"]
-
-    if nullable and random.random() < 0.2:
-        return None
-
-    if field_type == "bigint":
-        if field["name"] == "primary_id":
-            return random.randint(100000, 999999)
-        elif field["name"] == "offset" or field["name"] == "partition_id":
-            return random.randint(0, 1000)
-        elif field["name"] == "quantity":
-            return random.randint(1, 10)
-        return random.randint(0, 10000)
-
-    elif field_type == "varchar":
-        if field["name"] == "event_type":
-            return event_type
-        elif field["name"] in ["user_id", "session_id", "product_id"]:
-            return str(uuid.uuid4())
-        elif field["name"] == "items":
-            return ""  # Will be populated in purchase event with semicolon-separated product IDs
-        elif field["name"] == "page_url":
-            return fake.url()
-        elif field["name"] == "brand":
-            return random.choice(PRODUCT_BRANDS[random.choice(PRODUCT_CATEGORIES)])
-        elif field["name"] == "category":
-            return random.choice(PRODUCT_CATEGORIES)
-        elif field["name"] == "color":
-            return random.choice(PRODUCT_COLORS)
-        elif field["name"] == "size":
-            return random.choice(PRODUCT_SIZES[random.choice(PRODUCT_CATEGORIES)])
-        elif field["name"] == "type":
-            return random.choice(PRODUCT_TYPES[random.choice(PRODUCT_CATEGORIES)])
-        elif field["name"] in ["device_type", "platform", "currency", "payment_method"]:
-            return random.choice(DEVICE_TYPES if field["name"] == "device_type" else
-                              PLATFORMS if field["name"] == "platform" else
-                              CURRENCIES if field["name"] == "currency" else
-                              PAYMENT_METHODS)
-        return fake.word()[:size] if size else fake.word()
-
-    elif field_type in ["date", "datetime"]:
-        return fake.date_time_this_year(tzinfo=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-
-    elif field_type == "double":
-        if field["name"] in ["price", "amount"]:  # Explicitly handle price and amount as double
-            return round(random.uniform(10, 500), 2)
-        return round(random.uniform(10, 500), 2)
-
-    elif field_type == "boolean":
-        return random.choice([True, False])
-
-    raise ValueError(f"Unknown field type: {field_type}")
+                  EVENT_FIELD_RULES, BIGINT_RANGES)
+from sharding import (run_shards, plan_shards, part_path, clear_outputs, merge_parts, seed_generators,
+                      get_master_seed, input_files)
+from sessions import EVENT_TIME_FIELD, simulate_sessions, format_time, mean_session_length
+from value_pools import pooled
+from schema_plan import BUILTIN_FIELDS, compile_event_plans
+from columnar import ColumnBuffer, numpy_enabled
+from sampling import AliasSampler, build_sampler, apportion, spec_weights_or_uniform
+
+NUM_EVENTS = config.NUM_EVENTS
+DATA_PATH = data_path("events")
+# Varchar fields the columnar backend draws from a fixed list
+EVENT_CHOICES = {"category": PRODUCT_CATEGORIES, "color": PRODUCT_COLORS, "device_type": DEVICE_TYPES,
+                 "platform": PLATFORMS, "currency": CURRENCIES, "payment_method": PAYMENT_METHODS}
+
+# Cumulative weights built once; random.choices would rebuild them on every call
+MATCH_STATUSES = ["match", "no_match"]
+MATCH_CUM_WEIGHTS = list(accumulate([0.95, 0.05]))
+PAGE_TYPES = ["product", "category", "cart", "about", "home"]
+PAGE_TYPE_CUM_WEIGHTS = list(accumulate([0.5, 0.2, 0.1, 0.1, 0.1]))
+
+# Field types the schema must use whatever the inferred type of the generated values
+FORCED_FIELD_TYPES = {
+    "purchase": {"price": "DOUBLE", "amount": "DOUBLE", "items": "VARCHAR_1000"},
+    "add_to_cart": {"price": "DOUBLE"},
+}
+
+# Set by main() in the parent and by init_worker() in generation processes
+products = []
+product_ids = []
+customer_ids = []
+event_fields = []
+# Popularity samplers (see sampling.py), built by init_worker()
+pick_customer = None
+pick_product = None
+pick_event_type = None
+# Per event type field producers, compiled from event_fields by generate_shard()
+event_plans = {}
+
+def _product_attribute(values_by_category):
+    return random.choice(values_by_category[random.choice(PRODUCT_CATEGORIES)])
+
+# Varchar fields with their own value source; everything else is generated by type in schema_plan
+NAMED_PRODUCERS = {
+    ("varchar", "user_id"): random_uuid,
+    ("varchar", "session_id"): random_uuid,
+    ("varchar", "product_id"): random_uuid,
+    ("varchar", "items"): str,  # Will be populated in purchase event with semicolon-separated product IDs
+    ("varchar", "page_url"): partial(pooled, "url"),
+    ("varchar", "brand"): partial(_product_attribute, PRODUCT_BRANDS),
+    ("varchar", "category"): partial(random.choice, PRODUCT_CATEGORIES),
+    ("varchar", "color"): partial(random.choice, PRODUCT_COLORS),
+    ("varchar", "size"): partial(_product_attribute, PRODUCT_SIZES),
+    ("varchar", "type"): partial(_product_attribute, PRODUCT_TYPES),
+    ("varchar", "device_type"): partial(random.choice, DEVICE_TYPES),
+    ("varchar", "platform"): partial(random.choice, PLATFORMS),
+    ("varchar", "currency"): partial(random.choice, CURRENCIES),
+    ("varchar", "payment_method"): partial(random.choice, PAYMENT_METHODS),
+}
 
 def generate_event_data(event_name, user_id):
     event = {"event_type": event_name, "primary_id": user_id}
-    allowed_fields = EVENT_FIELD_RULES.get(event_name, set())
-
-    for field in event_fields:
-        if field["name"] in ["created_at", "offset", "partition_id"] and field["flags"]["tableBuildIn"]:
-            continue
-        if field["name"] in ["event_type", "primary_id"]:
-            continue
-        if field["name"] not in allowed_fields:
-            continue
-        if field["name"] == "user_id" and user_id:
+
+    for name, nullable, produce in event_plans.get(event_name, ()):
+        if name == "user_id" and user_id:
             event["user_id"] = user_id
         else:
-            value = generate_field_value(field, event_name)
-            if value is not None or not field["nullable"]:
-                event[field["name"]] = value
+            value = produce()
+            if value is not None or not nullable:
+                event[name] = value
 
     if event_name == "search":
-        search_query = random.choice(PRODUCT_BRANDS[random.choice(PRODUCT_CATEGORIES)]) + " " + fake.word()
+        search_query = random.choice(PRODUCT_BRANDS[random.choice(PRODUCT_CATEGORIES)]) + " " + pooled("word")
         event["search_query"] = search_query
 
-        match_status = random.choices(["match", "no_match"], weights=[0.95, 0.05])[0]
+        match_status = random.choices(MATCH_STATUSES, cum_weights=MATCH_CUM_WEIGHTS)[0]
         event["match_status"] = match_status
 
         if match_status == "match":
@@ -122,7 +91,7 @@ def generate_event_data(event_name, user_id):
             event["matching_product_ids"] = ";".join(matching_products)
 
     elif event_name in ["add_to_cart", "purchase"]:
-        product = random.choice(products)
+        product = pick_product()
         price = round(float(product["price"]), 2)
         event.update({
             "product_id": product["product_id"],
@@ -137,7 +106,7 @@ def generate_event_data(event_name, user_id):
             event["quantity"] = random.randint(1, 5)
         elif event_name == "purchase":
             quantity = random.randint(1, 5)
-            items = [random.choice(products) for _ in range(quantity)]
+            items = [pick_product() for _ in range(quantity)]
             event.update({
                 "quantity": quantity,
                 "amount": round(sum(float(p["price"]) for p in items), 2),
@@ -145,13 +114,10 @@ def generate_event_data(event_name, user_id):
             })
 
     elif event_name == "page_view":
-        page_type = random.choices(
-            ["product", "category", "cart", "about", "home"],
-            weights=[0.5, 0.2, 0.1, 0.1, 0.1]
-        )[0]
+        page_type = random.choices(PAGE_TYPES, cum_weights=PAGE_TYPE_CUM_WEIGHTS)[0]
 
         if page_type == "product":
-            product = random.choice(products)
+            product = pick_product()
             event.update({"page_url": f"/products/{product['product_id']}"})
         elif page_type == "category":
             category = random.choice(PRODUCT_CATEGORIES)
@@ -165,69 +131,227 @@ def generate_event_data(event_name, user_id):
 
     return event
 
-# Initialize events list and event_field_types dictionary
-events = []
-event_field_types = {}
-
-logger.info(f"Generating {NUM_EVENTS} events")
-for _ in range(NUM_EVENTS):
-    user_id = random.choice(customer_ids) if customer_ids else random.randint(100000, 999999)
-    event_type = random.choice(EVENT_TYPES)
-    event = generate_event_data(event_type, user_id)
-    events.append(event)
-    if event_type not in event_field_types:
-        event_field_types[event_type] = {}
-    for k, v in event.items():
-        if k not in event_field_types[event_type]:
-            event_field_types[event_type][k] = infer_dtype(v)
-logger.info(f"Generated {len(events)} events")
-
-fieldnames = set()
-for event in events:
-    fieldnames.update(event.keys())
-fieldnames = sorted(
-    [f["name"] for f in event_fields if f["name"] not in ["created_at", "offset", "partition_id"]] + list(
-        fieldnames - set(f["name"] for f in event_fields)))
-
-write_csv_with_types(events, "events.csv", fieldnames)
-
-event_mappings = defaultdict(set)
-for event in events:
-    event_name = event.get("event_type")
-    if not event_name:
-        continue
-    for key in event.keys():
-        if key != "event_type":
-            event_mappings[event_name].add(key)
-
-# Force correct data types for critical fields
-event_field_types["purchase"]["price"] = "DOUBLE"
-event_field_types["purchase"]["amount"] = "DOUBLE"
-event_field_types["purchase"]["items"] = "VARCHAR_1000"
-event_field_types["add_to_cart"]["price"] = "DOUBLE"
-
-field_definitions = []
-for event_type, fields in event_field_types.items():
-    for field, dtype in fields.items():
-        field_definitions.append({"name": field, "dtype": dtype})
-
-mappings_to_save = {
-    "fields": field_definitions,
-    "mappings": {event: list(fields) for event, fields in event_mappings.items()}
-}
-
-logger.info("Writing event mappings to event_mappings.json")
-with open("event_mappings.json", "w", encoding="utf-8") as f:
-    json.dump(mappings_to_save, f, indent=2)
-logger.info("Completed writing to event_mappings.json")
-
-variables = {
-    "customer_fields": customer_data["customer_field_types"],
-    "product_fields": product_data["product_field_types"],
-    "event_fields": event_field_types,
-    "event_field_rules": {event: list(fields) for event, fields in EVENT_FIELD_RULES.items()}
-}
-logger.info("Writing variables to variables.json")
-with open("variables.json", "w", encoding="utf-8") as f:
-    json.dump(variables, f, indent=2)
-logger.info("Completed writing to variables.json")
\ No newline at end of file
+# Keys generate_event_data can add on top of the tenant's event fields
+GENERATED_EVENT_FIELDS = {"event_type", "primary_id", "search_query", "match_status", "matching_product_ids",
+                          "product_id", "price", "brand", "category", "color", "size", "type",
+                          "quantity", "amount", "items", "page_url"}
+
+
+def generate_events(count):
+    for _ in range(count):
+        user_id = pick_customer() if customer_ids else random.randint(100000, 999999)
+        event_type = pick_event_type()
+        yield generate_event_data(event_type, user_id)
+
+
+def session_shards(all_customer_ids):
+    # Each shard simulates its own slice of the customers over the whole window, so every part is
+    # time-ordered and main() merges the parts by EVENT_TIME_FIELD. A shard's event count follows the
+    # popularity weight its slice holds, so the slices together draw from one distribution over all customers.
+    shards = plan_shards(NUM_EVENTS, config.GENERATION_SHARD_SIZE)
+    if not all_customer_ids:
+        return shards
+    weights = spec_weights_or_uniform(config.CUSTOMER_DISTRIBUTION, all_customer_ids)
+    shares = [sum(weights[index::len(shards)]) for index in range(len(shards))]
+    return list(enumerate(apportion(NUM_EVENTS, shares)))
+
+
+def generate_session_events(count, shard_index):
+    shard_count = len(plan_shards(NUM_EVENTS, config.GENERATION_SHARD_SIZE))
+    shard_customers = customer_ids[shard_index::shard_count]
+    pick_shard_customer = None
+    if count and shard_customers and config.CUSTOMER_DISTRIBUTION == "uniform":
+        pick_shard_customer = build_sampler("uniform", shard_customers)
+    elif count and shard_customers:
+        # Weights by each customer's rank among all customers, not within the slice
+        weights = spec_weights_or_uniform(config.CUSTOMER_DISTRIBUTION, customer_ids)[shard_index::shard_count]
+        pick_shard_customer = AliasSampler(shard_customers, weights)
+    end = DATE_RANGE[1]
+    session_types = ({event_type for event_type, fields in EVENT_FIELD_RULES.items() if "session_id" in fields}
+                     if any(f["name"] == "session_id" for f in event_fields) else set())
+    for timestamp, user_id, session_id, event_type in simulate_sessions(
+            count, pick_shard_customer, end - config.SESSION_DAYS * 86400, end):
+        event = generate_event_data(event_type, user_id)
+        if event_type in session_types:
+            event["session_id"] = session_id
+        event[EVENT_TIME_FIELD] = format_time(timestamp)
+        yield event
+
+
+def track_events(events, event_field_types, event_mappings, counter):
+    # Collect field types and mappings while the events stream through to the CSV writer
+    for event in events:
+        event_type = event["event_type"]
+        field_types = event_field_types.setdefault(event_type, {})
+        mapping = event_mappings[event_type]
+        for k, v in event.items():
+            if k == EVENT_TIME_FIELD:
+                continue
+            if k not in field_types:
+                field_types[k] = infer_dtype(v)
+            if k != "event_type":
+                mapping.add(k)
+        counter[event_type] += 1
+        yield event
+
+
+def event_fieldnames():
+    fieldnames = sorted(
+        {f["name"] for f in event_fields if f["name"] not in BUILTIN_FIELDS} | GENERATED_EVENT_FIELDS)
+    return [EVENT_TIME_FIELD] + fieldnames if config.EVENT_MODE == "sessions" else fieldnames
+
+
+def init_worker(shard_products, shard_customer_ids, shard_event_fields):
+    global products, product_ids, customer_ids, event_fields, pick_customer, pick_product, pick_event_type
+    products = shard_products
+    product_ids = [product["product_id"] for product in products]
+    customer_ids = shard_customer_ids
+    event_fields = shard_event_fields
+    pick_customer = build_sampler(config.CUSTOMER_DISTRIBUTION, customer_ids) if customer_ids else None
+    pick_product = build_sampler(config.PRODUCT_DISTRIBUTION, products)
+    pick_event_type = build_sampler(config.EVENT_TYPE_DISTRIBUTION, EVENT_TYPES)
+
+
+def generate_shard(shard_index, count, seed):
+    global event_plans
+    seed_generators(seed)
+    # Fields the numpy backend can produce in bulk are served from a ColumnBuffer
+    columns = ColumnBuffer(event_fields, seed, EVENT_CHOICES) if numpy_enabled() else None
+    event_plans = compile_event_plans(event_fields, EVENT_FIELD_RULES, NAMED_PRODUCERS, columns)
+    event_field_types = {}
+    event_mappings = defaultdict(set)
+    event_counts = Counter()
+    events = generate_session_events(count, shard_index) if config.EVENT_MODE == "sessions" else generate_events(count)
+    write_dataset(track_events(events, event_field_types, event_mappings, event_counts),
+                  part_path(DATA_PATH, shard_index), event_fieldnames())
+    return event_field_types, event_mappings, event_counts
+
+
+def load_products():
+    with open("product_data.json", "r", encoding="utf-8") as f:
+        product_data = json.load(f)
+
+    # Read all rows from the products.csv file
+    with open("products.csv", "r", encoding="utf-8") as csvfile:
+        reader = csv.DictReader(csvfile)
+        all_products = [row for row in reader]  # Create a list of all rows
+
+    # Ensure that each product has the correct product_id from product_data
+    all_products = [{**product, "product_id": pid} for product, pid in zip(all_products, product_data["product_ids"])]
+    return all_products, product_data
+
+
+def dataset_manifest(product_count, customer_count, event_counts):
+    # Sizes of the generated dataset, so capacity results can be plotted against the scale factor
+    event_count = sum(event_counts.values())
+    files = {}
+    for name in ("customers", "events"):
+        for path in input_files(data_path(name)):
+            files[path] = os.path.getsize(path)
+    return {
+        "scale_factor": config.SCALE_FACTOR or None,
+        "profile": config.PROFILE or None,
+        "seed": get_master_seed(),
+        "event_mode": config.EVENT_MODE,
+        "data_format": config.DATA_FORMAT,
+        "counts": {
+            "products": product_count,
+            "customers": customer_count,
+            "events": event_count,
+            "event_types": dict(sorted(event_counts.items())),
+            # Emergent from the simulation; the expected count from the mean session length
+            "sessions": round(event_count / mean_session_length()) if config.EVENT_MODE == "sessions" else None,
+        },
+        "ratios": {
+            "events_per_customer": round(event_count / customer_count, 4) if customer_count else None,
+            "customers_per_product": round(customer_count / product_count, 4) if product_count else None,
+        },
+        "primary_id_range": list(BIGINT_RANGES["primary_id"]),
+        "files": files,
+        "total_bytes": sum(files.values()),
+    }
+
+
+def main(tenant_id=None, products=None, product_data=None, customer_data=None):
+    # The pipeline runner (main.py) passes the earlier stages' results; run alone, they are read from files.
+    # Returns the event_mappings.json and variables.json contents.
+    if tenant_id is None:
+        with open("tenant.json", "r", encoding="utf-8") as f:
+            tenant_id = json.load(f)["tenant_id"]
+        logger.info(f"Loaded tenant_id: {tenant_id}")
+
+    if products is None:
+        all_products, product_data = load_products()
+    else:
+        all_products = products
+
+    if customer_data is None:
+        with open("customer_data.json", "r", encoding="utf-8") as f:
+            customer_data = json.load(f)
+
+    _, schema_fields, _ = get_tenant_schema(config.BASE_URL_1, tenant_id)
+    logger.info("Fetched tenant schema")
+
+    clear_outputs(DATA_PATH)
+    shards = session_shards(customer_data["customer_ids"]) if config.EVENT_MODE == "sessions" else None
+    results = run_shards(generate_shard, NUM_EVENTS, "events", initializer=init_worker,
+                         initargs=(all_products, customer_data["customer_ids"], schema_fields), shards=shards)
+    if config.GENERATION_MERGE_PARTS:
+        merge_parts(DATA_PATH, len(results), order_by=EVENT_TIME_FIELD if config.EVENT_MODE == "sessions" else None)
+
+    # Merge shard summaries in shard order so the result is the same for any process count
+    event_field_types = {}
+    event_mappings = defaultdict(set)
+    event_counts = Counter()
+    for shard_field_types, shard_mappings, shard_counts in results:
+        for event_type, field_types in shard_field_types.items():
+            merged = event_field_types.setdefault(event_type, {})
+            for k, dtype in field_types.items():
+                merged.setdefault(k, dtype)
+        for event_type, keys in shard_mappings.items():
+            event_mappings[event_type] |= keys
+        event_counts.update(shard_counts)
+    logger.info(f"Generated {sum(event_counts.values())} events: {dict(event_counts)}")
+
+    # Force correct data types for critical fields, on the event types this run generated
+    for event_type, field_types in FORCED_FIELD_TYPES.items():
+        if event_type in event_field_types:
+            event_field_types[event_type].update(field_types)
+
+    field_definitions = []
+    for event_type, fields in event_field_types.items():
+        for field, dtype in fields.items():
+            field_definitions.append({"name": field, "dtype": dtype})
+
+    mappings_to_save = {
+        "fields": field_definitions,
+        "mappings": {event: sorted(fields) for event, fields in event_mappings.items()}
+    }
+
+    logger.info("Writing event mappings to event_mappings.json")
+    with open("event_mappings.json", "w", encoding="utf-8") as f:
+        json.dump(mappings_to_save, f, indent=2)
+    logger.info("Completed writing to event_mappings.json")
+
+    variables = {
+        "customer_fields": customer_data["customer_field_types"],
+        "product_fields": product_data["product_field_types"],
+        "event_fields": event_field_types,
+        "event_field_rules": {event: list(fields) for event, fields in EVENT_FIELD_RULES.items()}
+    }
+    logger.info("Writing variables to variables.json")
+    with open("variables.json", "w", encoding="utf-8") as f:
+        json.dump(variables, f, indent=2)
+    logger.info("Completed writing to variables.json")
+
+    manifest = dataset_manifest(len(all_products), len(customer_data["customer_ids"]), event_counts)
+    logger.info("Writing dataset manifest to dataset_manifest.json")
+    with open("dataset_manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Dataset: {manifest['counts']['customers']} customers, {manifest['counts']['products']} products, "
+                f"{manifest['counts']['events']} events, {manifest['total_bytes']} bytes")
+    return mappings_to_save, variables
+
+
+if __name__ == "__main__":
+    main()
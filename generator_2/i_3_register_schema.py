@@ -2,7 +2,10 @@ import os
 import json
 import requests
 import config
+import schema_cache
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from ingest import get_session
 
 logger = config.logger
 
@@ -40,21 +43,17 @@ def load_mappings():
         raise FileNotFoundError(f"{MAPPINGS_FILE} not found. Run generator first.")
     with open(MAPPINGS_FILE, "r", encoding="utf-8") as f:
         data = json.load(f)
-        # Deduplicate fields by name
-        seen = set()
-        data["fields"] = [f for f in data["fields"] if not (f["name"] in seen or seen.add(f["name"]))]
-        logger.info(f"Loaded and deduplicated mappings from {MAPPINGS_FILE}")
-        return data
+        logger.info(f"Loaded mappings from {MAPPINGS_FILE}")
+        return dedupe_fields(data)
+
+def dedupe_fields(data):
+    # Deduplicate fields by name
+    seen = set()
+    return {**data, "fields": [f for f in data["fields"] if not (f["name"] in seen or seen.add(f["name"]))]}
 
 def get_existing_fields(base_url, tenant_id):
-    url = f"{base_url}/api/tenants/{tenant_id}/info"
-    logger.info(f"Fetching existing fields from {url}")
-    response = requests.get(url)
-    config.handle_curl_debug("GET", url, headers=None, data=None, response=response)
-    if not response.ok:
-        logger.error(f"Failed to fetch tenant info: {response.status_code} {response.text}")
-        raise Exception(f"Failed to fetch tenant info: {response.status_code} {response.text}")
-    data = response.json()
+    # Fetched once per run by main(); the post_* functions take the result instead of refetching
+    data = schema_cache.fetch_tenant_info(base_url, tenant_id)
     customer_fields = {field["name"] for field in data.get("customerFields", [])}
     event_fields = {field["name"] for field in data.get("eventFields", [])}
     product_fields = {field["name"] for field in data.get("productFields", [])}
@@ -72,22 +71,37 @@ def get_existing_event_mappings(base_url, tenant_id):
     logger.info("Fetched existing event mappings")
     return data.get("mappings", {})
 
-def post_new_customer_fields(fields, base_url, tenant_id):
-    existing_customer_fields, _, _ = get_existing_fields(base_url, tenant_id)
+def register_draft_fields(kind, payloads, base_url, tenant_id):
+    # Draft fields are independent of each other, so they are posted concurrently over keep-alive sessions
+    url = f"{base_url}/api/tenants/{tenant_id}/schema/{kind}/fields/draft"
+
+    def register(payload):
+        logger.info(f"Registering {kind} field: {payload['name']}")
+        response = get_session().post(url, json=payload)
+        config.handle_curl_debug("POST", url, headers=None, data=payload, response=response)
+        logger.info(f"{kind} field: {payload['name']} -> {response.status_code}")
+        return payload, response
+
+    if not payloads:
+        return
+    schema_cache.invalidate(tenant_id)
+    with ThreadPoolExecutor(max_workers=min(config.SCHEMA_REGISTER_WORKERS, len(payloads))) as pool:
+        results = list(pool.map(register, payloads))
+    failed = [(payload, response) for payload, response in results if not response.ok]
+    for payload, response in failed:
+        logger.error(f"Failed to register {kind} field: {payload['name']} with payload {json.dumps(payload)} to {url}: {response.status_code} {response.text}")
+    assert not failed, f"Failed to register {len(failed)} {kind} fields: {failed[0][1].text}"
+
+def post_new_customer_fields(fields, base_url, tenant_id, existing_customer_fields):
+    payloads = []
     for field_name, field_type in fields.items():
         if field_name in existing_customer_fields:
             logger.info(f"Customer field {field_name} already exists, skipping")
             continue
-        payload = {"name": field_name, "dtype": field_type}
-        url = f"{base_url}/api/tenants/{tenant_id}/schema/customers/fields/draft"
-        logger.info(f"Registering customer field: {field_name}")
-        response = requests.post(url, json=payload)
-        config.handle_curl_debug("POST", url, headers=None, data=payload, response=response)
-        logger.info(f"Customer field: {field_name} -> {response.status_code}")
-        assert response.ok, f"Failed to register customer field: {response.text}"
+        payloads.append({"name": field_name, "dtype": field_type})
+    register_draft_fields("customers", payloads, base_url, tenant_id)
 
-# def post_new_product_fields(fields, base_url, tenant_id):
-#     _, _, existing_product_fields = get_existing_fields(base_url, tenant_id)
+# def post_new_product_fields(fields, base_url, tenant_id, existing_product_fields):
 #     for field_name, field_type in fields.items():
 #         if field_name in existing_product_fields:
 #             logger.info(f"Product field {field_name} already exists, skipping")
@@ -100,9 +114,8 @@ def post_new_customer_fields(fields, base_url, tenant_id):
 #         logger.info(f"Product field: {field_name} -> {response.status_code}")
 #         assert response.ok, f"Failed to register product field: {response.text}"
 
-def post_new_event_fields(fields, base_url, tenant_id):
-    _, existing_fields, _ = get_existing_fields(base_url, tenant_id)
-    new_fields = []
+def post_new_event_fields(fields, base_url, tenant_id, existing_fields):
+    payloads = []
     seen_fields = set()  # Track processed field names
     for field in fields:
         field_name = field["name"]
@@ -113,23 +126,13 @@ def post_new_event_fields(fields, base_url, tenant_id):
         if field_name in existing_fields:
             logger.info(f"Event field {field_name} already exists, skipping")
             continue
-        payload = {"name": field_name, "dtype": field["dtype"]}
-        url = f"{base_url}/api/tenants/{tenant_id}/schema/events/fields/draft"
-        logger.info(f"Registering event field: {field_name}")
-        response = requests.post(url, json=payload)
-        config.handle_curl_debug("POST", url, headers=None, data=payload, response=response)
-        logger.info(f"Event field: {field_name} -> {response.status_code}")
-        if not response.ok:
-            logger.error(f"Failed to register event field: {field_name} with payload {json.dumps(payload)} to {url}: {response.status_code} {response.text}")
-        assert response.ok, f"Failed to register event field: {response.text}"
-        new_fields.append(field_name)
-    return new_fields
-
-def post_new_event_mappings(mappings, base_url, tenant_id, new_fields):
+        payloads.append({"name": field_name, "dtype": field["dtype"]})
+    register_draft_fields("events", payloads, base_url, tenant_id)
+    return [payload["name"] for payload in payloads]
+
+def post_new_event_mappings(mappings, base_url, tenant_id, new_fields, existing_event_fields, event_field_rules):
     existing_mappings = get_existing_event_mappings(base_url, tenant_id)
-    _, existing_event_fields, _ = get_existing_fields(base_url, tenant_id)
     all_event_fields = existing_event_fields.union(new_fields)
-    event_field_rules = load_variable("event_field_rules")
 
     new_mappings = defaultdict(list)
     for event_name, fields in mappings.items():
@@ -154,13 +157,21 @@ def post_new_event_mappings(mappings, base_url, tenant_id, new_fields):
     logger.info(f"Mappings POST -> {response.status_code}")
     assert response.ok, f"Failed to post mappings: {response.text}"
 
-if __name__ == "__main__":
+def main(tenant_id=None, variables=None, mappings_data=None):
+    # The pipeline runner (main.py) passes the generators' variables and mappings; run alone, they are read from files
     base_url = config.BASE_URL_1
-    tenant_id = load_tenant_id()
-    customer_fields = load_variable("customer_fields")
-    product_fields = load_variable("product_fields")
-    mappings_data = load_mappings()
-    post_new_customer_fields(customer_fields, base_url, tenant_id)
-    # post_new_product_fields(product_fields, base_url, tenant_id)
-    new_event_fields = post_new_event_fields(mappings_data["fields"], base_url, tenant_id)
-    post_new_event_mappings(mappings_data["mappings"], base_url, tenant_id, new_event_fields)
\ No newline at end of file
+    if tenant_id is None:
+        tenant_id = load_tenant_id()
+    if variables is None:
+        variables = {key: load_variable(key) for key in ("customer_fields", "product_fields", "event_field_rules")}
+    customer_fields = variables["customer_fields"]
+    mappings_data = load_mappings() if mappings_data is None else dedupe_fields(mappings_data)
+    existing_customer_fields, existing_event_fields, existing_product_fields = get_existing_fields(base_url, tenant_id)
+    post_new_customer_fields(customer_fields, base_url, tenant_id, existing_customer_fields)
+    # post_new_product_fields(variables["product_fields"], base_url, tenant_id, existing_product_fields)
+    new_event_fields = post_new_event_fields(mappings_data["fields"], base_url, tenant_id, existing_event_fields)
+    post_new_event_mappings(mappings_data["mappings"], base_url, tenant_id, new_event_fields, existing_event_fields,
+                            variables["event_field_rules"])
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,17 +1,16 @@
-import csv
-import time
+import argparse
 import json
-import requests
 import config
+from sharding import input_files
+from row_index import Dataset
+from send_journal import open_journal
+from utils import data_path
+from ingest import journaled_post, post_record, send_records_async
+from rate_limiter import build_rate_limiter
 
 logger = config.logger
 
-with open("tenant.json", encoding="utf-8") as f:
-    tenant_id = json.load(f)["tenant_id"]
-logger.info(f"Loaded tenant_id: {tenant_id}")
-
-CSV_PATH = "customers.csv"
-API_ENDPOINT = f"{config.BASE_URL_2}/cdp-ignest/ingest/tenant/{tenant_id}/customer"
+DATA_PATH = data_path("customers")
 
 headers = {"Content-Type": "application/json"}
 if config.AUTH_TOKEN:
@@ -19,28 +18,69 @@ if config.AUTH_TOKEN:
 
 NUMERIC_FIELDS = ["primary_id"]
 
-logger.info(f"Reading customers from {CSV_PATH}")
-with open(CSV_PATH, newline='', encoding='utf-8') as csvfile:
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-        parsed_row = {}
-        for k, v in row.items():
-            if v == "":
-                parsed_row[k] = None
-            elif k in NUMERIC_FIELDS:
-                parsed_row[k] = int(v)
-            elif v.lower() in ("true", "false"):
-                parsed_row[k] = v.lower() == "true"
-            else:
-                parsed_row[k] = v
-        try:
-            logger.info(f"Sending customer: {parsed_row.get('primary_id')}")
-            response = requests.post(API_ENDPOINT, json=parsed_row, headers=headers)
-            logger.info(f"Response [{response.status_code}]: {response.text}")
-            config.handle_curl_debug("POST", API_ENDPOINT, headers, parsed_row, response)
-        except Exception as e:
-            logger.error(f"Error sending customer: {e}")
-            config.handle_curl_debug("POST", API_ENDPOINT, headers, parsed_row, response=None)
-
-        time.sleep(config.DELAY_BETWEEN_REQUESTS)
-logger.info("Completed sending customers")
\ No newline at end of file
+
+def parse_row(row):
+    parsed_row = {}
+    for k, v in row.items():
+        if v == "":
+            parsed_row[k] = None
+        elif k in NUMERIC_FIELDS:
+            parsed_row[k] = int(v)
+        elif v.lower() in ("true", "false"):
+            parsed_row[k] = v.lower() == "true"
+        else:
+            parsed_row[k] = v
+    return parsed_row
+
+
+def read_customers(dataset, ranges):
+    # Yields (row_number, customer); record streams keep generated types, no parsing needed
+    fieldnames = dataset.fieldnames
+    for row_number, row in dataset.rows_in(ranges):
+        yield row_number, dict(zip(fieldnames, row)) if dataset.typed else parse_row(row)
+
+
+def send_serial(customers, url, journal):
+    # journaled_post acknowledges delivered and dead-lettered rows alike, as in the other send paths
+    limiter = build_rate_limiter()
+    post = journaled_post(post_record, journal) if journal else None
+    for row_number, parsed_row in customers:
+        if limiter:
+            limiter.acquire()
+        if post:
+            post(url, headers, ([row_number], parsed_row), "customer")
+        else:
+            post_record(url, headers, parsed_row, "customer")
+
+
+def main(argv=None, tenant_id=None):
+    parser = argparse.ArgumentParser(description="Send generated customers to the ingest service")
+    parser.add_argument("--resume", action="store_true", help="skip customers already acknowledged by an earlier run")
+    args = parser.parse_args(argv)
+
+    if tenant_id is None:
+        with open("tenant.json", encoding="utf-8") as f:
+            tenant_id = json.load(f)["tenant_id"]
+        logger.info(f"Loaded tenant_id: {tenant_id}")
+    url = f"{config.BASE_URL_2}/cdp-ignest/ingest/tenant/{tenant_id}/customer"
+
+    dataset = Dataset(input_files(DATA_PATH))
+    logger.info(f"Reading {len(dataset)} customers from {DATA_PATH}")
+    journal = open_journal(tenant_id, DATA_PATH, dataset.filenames, args.resume)
+    ranges = journal.pending_ranges(0, len(dataset)) if journal else [(0, len(dataset))]
+    if journal:
+        logger.info(f"{sum(high - low for low, high in ranges)} of {len(dataset)} customers left to send")
+    customers = read_customers(dataset, ranges)
+    if config.CUSTOMER_SEND_MODE == "async":
+        if not journal:
+            customers = (customer for _, customer in customers)
+        send_records_async(customers, url, headers, label="customer", journal=journal)
+    else:
+        send_serial(customers, url, journal)
+    if journal:
+        journal.close()
+    logger.info("Completed sending customers")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,19 @@
-import csv
-import time
+import argparse
+import heapq
 import json
-import requests
+import time
+from operator import itemgetter
 import config
+from sharding import input_files
+from row_index import Dataset
+from send_journal import SendJournal, open_journal
+from utils import data_path
+from ingest import send_records, send_ranges, SendStats
+from sessions import EVENT_TIME_FIELD, parse_time
 
 logger = config.logger
 
-with open("tenant.json", encoding="utf-8") as f:
-    tenant_id = json.load(f)["tenant_id"]
-logger.info(f"Loaded tenant_id: {tenant_id}")
-
-with open("variables.json", encoding="utf-8") as f:
-    variables = json.load(f)
-    EVENT_FIELD_RULES = {event: set(fields) for event, fields in variables.get("event_field_rules", {}).items()}
-logger.info("Loaded event field rules")
-
-CSV_PATH = "events.csv"
-API_ENDPOINT = f"{config.BASE_URL_2}/cdp-ignest/ingest/tenant/{tenant_id}/event"
+DATA_PATH = data_path("events")
 headers = {"Content-Type": "application/json"}
 if config.AUTH_TOKEN:
     headers["Authorization"] = config.AUTH_TOKEN
@@ -24,33 +21,163 @@ if config.AUTH_TOKEN:
 NUMERIC_FIELDS = ["primary_id", "quantity", "offset", "partition_id"]
 FLOAT_FIELDS = ["amount", "price"]
 
-logger.info(f"Reading events from {CSV_PATH}")
-with open(CSV_PATH, newline='', encoding='utf-8') as csvfile:
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-        parsed_row = {}
-        event_type = row.get("event_type")
-        allowed_fields = EVENT_FIELD_RULES.get(event_type, set()) | {"event_type"}
-        for k, v in row.items():
-            if k not in allowed_fields:
-                continue
-            if v == "":
-                parsed_row[k] = None
-            elif k in NUMERIC_FIELDS:
-                parsed_row[k] = int(v) if v.replace("-", "").isdigit() else v
-            elif k in FLOAT_FIELDS:
-                parsed_row[k] = float(v) if v.replace(".", "").replace("-", "").isdigit() else v
-            elif v.lower() in ("true", "false"):
-                parsed_row[k] = v.lower() == "true"
-            else:
-                parsed_row[k] = v
-        try:
-            logger.info(f"Sending event: {event_type} (primary_id: {parsed_row.get('primary_id')})")
-            response = requests.post(API_ENDPOINT, json=parsed_row, headers=headers)
-            logger.info(f"Response [{response.status_code}]: {response.text}")
-            config.handle_curl_debug("POST", API_ENDPOINT, headers, parsed_row, response)
-        except Exception as e:
-            logger.error(f"Error sending event: {e}")
-            config.handle_curl_debug("POST", API_ENDPOINT, headers, parsed_row, response=None)
-        time.sleep(config.DELAY_BETWEEN_REQUESTS)
-logger.info("Completed sending events")
\ No newline at end of file
+# Set by init_worker, in this process or in each sending process
+TENANT_ID = None
+API_ENDPOINT = None
+EVENT_FIELD_RULES = {}
+
+
+def load_event_field_rules(variables=None):
+    if variables is None:
+        with open("variables.json", encoding="utf-8") as f:
+            variables = json.load(f)
+        logger.info("Loaded event field rules")
+    return {event: set(fields) for event, fields in variables.get("event_field_rules", {}).items()}
+
+
+def init_worker(tenant_id, url, rules):
+    global TENANT_ID, API_ENDPOINT, EVENT_FIELD_RULES
+    TENANT_ID = tenant_id
+    API_ENDPOINT = url
+    EVENT_FIELD_RULES = rules
+
+
+def parse_row(row):
+    parsed_row = {}
+    event_type = row.get("event_type")
+    allowed_fields = EVENT_FIELD_RULES.get(event_type, set()) | {"event_type"}
+    for k, v in row.items():
+        if k not in allowed_fields:
+            continue
+        if v == "":
+            parsed_row[k] = None
+        elif k in NUMERIC_FIELDS:
+            parsed_row[k] = int(v) if v.replace("-", "").isdigit() else v
+        elif k in FLOAT_FIELDS:
+            parsed_row[k] = float(v) if v.replace(".", "").replace("-", "").isdigit() else v
+        elif v.lower() in ("true", "false"):
+            parsed_row[k] = v.lower() == "true"
+        else:
+            parsed_row[k] = v
+    return parsed_row
+
+
+def typed_row_parser(fieldnames):
+    # Record streams keep generated types, so only the per-event-type field filter is left to do
+    type_index = fieldnames.index("event_type")
+    columns_by_type = {}
+
+    def parse(row):
+        event_type = row[type_index]
+        columns = columns_by_type.get(event_type)
+        if columns is None:
+            allowed_fields = EVENT_FIELD_RULES.get(event_type, set()) | {"event_type"}
+            columns = columns_by_type[event_type] = [(i, k) for i, k in enumerate(fieldnames) if k in allowed_fields]
+        return {k: row[i] for i, k in columns}
+
+    return parse
+
+
+def read_events(dataset, ranges, journal=None):
+    # With a journal the send path needs row numbers to acknowledge, so yield (row_number, event)
+    parse = typed_row_parser(dataset.fieldnames) if dataset.typed else parse_row
+    for row_number, row in dataset.rows_in(ranges):
+        yield (row_number, parse(row)) if journal else parse(row)
+
+
+def time_ordered_rows(dataset, ranges):
+    # (event_time, row_number, row) across all files; each part is time-ordered, so merging them keeps the order
+    time_of = itemgetter(dataset.fieldnames.index(EVENT_TIME_FIELD) if dataset.typed else EVENT_TIME_FIELD)
+    streams = []
+    for low, high in zip(dataset.starts, dataset.starts[1:]):
+        file_ranges = [(max(start, low), min(stop, high)) for start, stop in ranges if start < high and stop > low]
+        streams.append((time_of(row), row_number, row) for row_number, row in dataset.rows_in(file_ranges))
+    return heapq.merge(*streams)
+
+
+def replay_events(dataset, ranges, journal, speedup, since=None, until=None):
+    """Yield events when their event_time comes round, with the gaps between them divided by speedup.
+
+    since and until are ISO 8601 prefixes such as 2025-06-01T18; only events between them are sent.
+    """
+    parse = typed_row_parser(dataset.fieldnames) if dataset.typed else parse_row
+    first = started = None
+    for event_time, row_number, row in time_ordered_rows(dataset, ranges):
+        if until and event_time >= until:
+            break
+        if since and event_time < since:
+            continue
+        timestamp = parse_time(event_time)
+        if first is None:
+            first, started = timestamp, time.monotonic()
+        delay = started + (timestamp - first) / speedup - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        yield (row_number, parse(row)) if journal else parse(row)
+
+
+def send_events(dataset, start, stop, journal, label="event", stats=None):
+    ranges = journal.pending_ranges(start, stop) if journal else [(start, stop)]
+    if journal:
+        logger.info(f"{sum(high - low for low, high in ranges)} of {stop - start} {label}s in rows {start}:{stop} left to send")
+    return send_records(read_events(dataset, ranges, journal), API_ENDPOINT, headers, label=label, stats=stats,
+                        journal=journal)
+
+
+def send_range(start, stop):
+    dataset = Dataset(input_files(DATA_PATH))
+    journal = SendJournal(config.SEND_JOURNAL, TENANT_ID, DATA_PATH) if config.SEND_JOURNAL else None
+    stats = SendStats()
+    logger.info(f"Sending events in rows {start}:{stop}")
+    send_events(dataset, start, stop, journal, stats=stats)
+    if journal:
+        journal.close()
+    return stats
+
+
+def main(argv=None, tenant_id=None, variables=None):
+    parser = argparse.ArgumentParser(description="Send generated events to the ingest service")
+    parser.add_argument("--resume", action="store_true", help="skip events already acknowledged by an earlier run")
+    parser.add_argument("--replay", type=float, metavar="SPEEDUP",
+                        help="send events at their generated times, sped up by this factor (needs CDP_EVENT_MODE=sessions data)")
+    parser.add_argument("--since", help="with --replay, skip events before this ISO 8601 time")
+    parser.add_argument("--until", help="with --replay, stop at this ISO 8601 time")
+    args = parser.parse_args(argv)
+
+    if tenant_id is None:
+        with open("tenant.json", encoding="utf-8") as f:
+            tenant_id = json.load(f)["tenant_id"]
+        logger.info(f"Loaded tenant_id: {tenant_id}")
+
+    url = f"{config.BASE_URL_2}/cdp-ignest/ingest/tenant/{tenant_id}/event"
+    rules = load_event_field_rules(variables)
+    init_worker(tenant_id, url, rules)
+
+    dataset = Dataset(input_files(DATA_PATH))
+    logger.info(f"Reading {len(dataset)} events from {DATA_PATH}")
+    journal = open_journal(tenant_id, DATA_PATH, dataset.filenames, args.resume)
+    if args.replay:
+        if EVENT_TIME_FIELD not in dataset.fieldnames:
+            parser.error(f"{DATA_PATH} has no {EVENT_TIME_FIELD} column; generate it with CDP_EVENT_MODE=sessions")
+        # Pacing needs one time-ordered stream, so a replay always sends from this process
+        ranges = journal.pending_ranges(0, len(dataset)) if journal else [(0, len(dataset))]
+        logger.info(f"Replaying events at {args.replay}x from {args.since or 'the start'} to {args.until or 'the end'}")
+        send_records(replay_events(dataset, ranges, journal, args.replay, args.since, args.until), url, headers,
+                     label="event", journal=journal)
+        if journal:
+            journal.close()
+    elif config.SEND_PROCESSES > 1:
+        # Each process opens the journal itself, so only the (possibly reset) state is shared
+        if journal:
+            journal.close()
+        send_ranges(send_range, dataset.split(config.SEND_PROCESSES), label="event",
+                    initializer=init_worker, initargs=(tenant_id, url, rules))
+    else:
+        send_events(dataset, 0, len(dataset), journal)
+        if journal:
+            journal.close()
+    logger.info("Completed sending events")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import hashlib
+import random
+
+# Identifier allocation for the generators.
+# Primary ids come from IdPermutation, a seeded bijection from row numbers onto the id range: shards that
+# take disjoint row ranges get disjoint ids with no coordination, unlike random.randint, which collides
+# once the row count approaches the square root of the range.
+# UUIDs are cut from one block of seeded random bytes at a time instead of one getrandbits call and
+# uuid.UUID object per id.
+
+UUID_BLOCK = 4096  # UUIDs generated per block of random bytes
+FEISTEL_ROUNDS = 4
+
+_uuids = []
+
+
+class IdPermutation:
+    """Maps row numbers 0..size-1 onto distinct ids in low..high, in an order fixed by seed."""
+
+    def __init__(self, low, high, seed):
+        self.low = low
+        self.size = high - low + 1
+        # Balanced Feistel network over the smallest even bit width covering the range
+        bits = max(2, (self.size - 1).bit_length())
+        self.half = (bits + 1) // 2
+        self.mask = (1 << self.half) - 1
+        self.keys = [int.from_bytes(hashlib.sha256(f"{seed}:{r}".encode()).digest()[:8], "big")
+                     for r in range(FEISTEL_ROUNDS)]
+
+    def _encrypt(self, x):
+        left, right = x >> self.half, x & self.mask
+        for key in self.keys:
+            left, right = right, left ^ ((((right ^ key) * 0x9E3779B97F4A7C15) >> 29) & self.mask)
+        return (left << self.half) | right
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError(f"Row {index} is outside an id range of {self.size}")
+        # Cycle-walk: values past the range are encrypted again until they land inside it
+        x = self._encrypt(index)
+        while x >= self.size:
+            x = self._encrypt(x)
+        return self.low + x
+
+    def block(self, start, count):
+        return [self[index] for index in range(start, start + count)]
+
+
+def uuid_block(count):
+    """count random (version 4) UUID strings made from a single block of seeded random bytes."""
+    raw = bytearray(random.randbytes(16 * count))
+    raw[6::16] = bytes(b & 0x0F | 0x40 for b in raw[6::16])  # version 4
+    raw[8::16] = bytes(b & 0x3F | 0x80 for b in raw[8::16])  # RFC 4122 variant
+    h = raw.hex()
+    return [f"{h[i:i + 8]}-{h[i + 8:i + 12]}-{h[i + 12:i + 16]}-{h[i + 16:i + 20]}-{h[i + 20:i + 32]}"
+            for i in range(0, len(h), 32)]
+
+
+def next_uuid():
+    if not _uuids:
+        _uuids.extend(reversed(uuid_block(UUID_BLOCK)))
+    return _uuids.pop()
+
+
+def reset():
+    # Called when the generators are reseeded, so no UUIDs drawn under the previous seed are handed out
+    _uuids.clear()
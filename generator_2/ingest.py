@@ -0,0 +1,384 @@
+import asyncio
+import json
+import multiprocessing
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import requests
+from requests.adapters import HTTPAdapter
+import config
+from dead_letter import write_dead_letters
+from metrics import ForwardedStats, SendStats, expose, is_ok, report_stats, report_to, track
+from rate_limiter import build_rate_limiter
+
+logger = config.logger
+
+# One keep-alive session per worker thread
+_local = threading.local()
+# Retry jitter stays independent of the seeded generators
+_jitter = random.Random()
+
+
+def get_session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _local.session = session
+    return session
+
+
+def is_retryable(status):
+    # None means the request never got a response (connection reset, timeout)
+    return status is None or status in config.SEND_RETRY_STATUS_CODES
+
+
+def backoff_delay(retry, response=None):
+    # Full jitter: uniform in [0, base * 2^retry], capped; a Retry-After header sets a floor
+    delay = _jitter.uniform(0, min(config.SEND_RETRY_MAX_DELAY, config.SEND_RETRY_BASE_DELAY * 2 ** retry))
+    retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+    if retry_after.isdigit():
+        delay = max(delay, min(float(retry_after), config.SEND_RETRY_MAX_DELAY))
+    return delay
+
+
+def post_with_retry(url, label, **kwargs):
+    """POST until the response is not retryable or SEND_RETRY_ATTEMPTS run out.
+
+    Returns (response, attempts, error); response is None when the last attempt raised.
+    Each attempt is (status, latency, bytes_sent).
+    """
+    size = len(kwargs.get("data") or b"")
+    attempts = []
+    response = error = None
+    for retry in range(max(config.SEND_RETRY_ATTEMPTS, 1)):
+        if retry:
+            delay = backoff_delay(retry - 1, response)
+            logger.warning(f"Retrying {label} in {delay:.2f}s after {response.status_code if response is not None else error}")
+            time.sleep(delay)
+        start = time.perf_counter()
+        try:
+            response, error = get_session().post(url, **kwargs), None
+        except requests.RequestException as e:
+            response, error = None, e
+        attempts.append((response.status_code if response is not None else None, time.perf_counter() - start, size))
+        if response is not None and not is_retryable(response.status_code):
+            break
+    return response, attempts, error
+
+
+def post_record(url, headers, record, label, on_ok=None, on_dead=None, dead_letters=None):
+    # Returns ([(status, latency, bytes_sent)], ok_records, failed_records) with one entry per attempt,
+    # the same shape as post_batch. on_ok(offset, count) and on_dead(offset, count) are called for delivered
+    # and dead-lettered records, as with post_batch; dead_letters overrides the SEND_DEAD_LETTER file
+    # Successful requests are logged 1 in LOG_SUCCESS_SAMPLE, failures always
+    sampled = config.sample_success()
+    try:
+        if sampled:
+            logger.info("Sending %s: %s (primary_id: %s)", label, record.get("event_type", label), record.get("primary_id"))
+        body = json.dumps(record, ensure_ascii=False).encode("utf-8")
+        response, attempts, error = post_with_retry(url, label, data=body,
+                                                    headers={"Content-Type": "application/json", **headers})
+    except Exception as e:
+        response, attempts, error = None, [(None, 0.0, 0)], e
+    if response is None:
+        logger.error(f"Error sending {label}: {error}")
+        config.handle_curl_debug("POST", url, headers, record, response=None)
+        if write_dead_letters(url, label, [record], error=error, path=dead_letters) and on_dead:
+            on_dead(0, 1)
+        return attempts, 0, 1
+    ok = is_ok(response.status_code)
+    if sampled or not ok:
+        logger.info("Response [%s]: %s", response.status_code, response.text)
+    config.handle_curl_debug("POST", url, headers, record, response, sampled=sampled)
+    if ok and on_ok:
+        on_ok(0, 1)
+    elif not ok and write_dead_letters(url, label, [record], status=response.status_code, path=dead_letters) and on_dead:
+        on_dead(0, 1)
+    return attempts, int(ok), int(not ok)
+
+
+def encode_batch(batch):
+    if config.SEND_BATCH_FORMAT == "ndjson":
+        return "\n".join(json.dumps(record, ensure_ascii=False) for record in batch).encode("utf-8"), "application/x-ndjson"
+    return json.dumps(batch, ensure_ascii=False).encode("utf-8"), "application/json"
+
+
+def at_offset(callback, offset):
+    # Shifts an on_ok/on_dead callback from a single record's offset 0 to its place in the batch
+    if callback is None:
+        return None
+    return lambda _, count: callback(offset, count)
+
+
+def post_batch(url, headers, batch, label, on_ok=None, offset=0, on_dead=None, dead_letters=None):
+    # on_ok(offset, count) is called for every slice of the batch the endpoint accepted,
+    # on_dead(offset, count) for every slice written to the dead-letter file
+    body, content_type = encode_batch(batch)
+    sampled = config.sample_success()
+    try:
+        if sampled:
+            logger.info("Sending batch of %d %ss", len(batch), label)
+        response, attempts, error = post_with_retry(url, f"batch of {len(batch)} {label}s", data=body,
+                                                    headers={**headers, "Content-Type": content_type})
+    except Exception as e:
+        response, attempts, error = None, [(None, 0.0, 0)], e
+    if response is None:
+        logger.error(f"Error sending batch of {len(batch)} {label}s: {error}")
+        config.handle_curl_debug("POST", url, headers, batch, response=None)
+        if write_dead_letters(url, label, batch, error=error, path=dead_letters) and on_dead:
+            on_dead(offset, len(batch))
+        return attempts, 0, len(batch)
+    if sampled or not is_ok(response.status_code):
+        logger.info("Response [%s]: %s", response.status_code, response.text)
+    config.handle_curl_debug("POST", url, headers, batch, response, sampled=sampled)
+
+    if is_ok(response.status_code):
+        if on_ok:
+            on_ok(offset, len(batch))
+        return attempts, len(batch), 0
+    if response.status_code not in config.SEND_BATCH_SPLIT_STATUS_CODES:
+        if write_dead_letters(url, label, batch, status=response.status_code, path=dead_letters) and on_dead:
+            on_dead(offset, len(batch))
+        return attempts, 0, len(batch)
+    if len(batch) == 1:
+        # Split down to one record: send it as a bare object, the body an unbatched endpoint accepts
+        record_attempts, ok, failed = post_record(url, headers, batch[0], label, on_ok=at_offset(on_ok, offset),
+                                                  on_dead=at_offset(on_dead, offset), dead_letters=dead_letters)
+        return attempts + record_attempts, ok, failed
+
+    # The endpoint rejected the batch as a whole: split it and resend both halves
+    logger.warning(f"Batch of {len(batch)} {label}s rejected [{response.status_code}], splitting")
+    middle = len(batch) // 2
+    ok = failed = 0
+    for half, half_offset in ((batch[:middle], offset), (batch[middle:], offset + middle)):
+        half_attempts, half_ok, half_failed = post_batch(url, headers, half, label, on_ok, half_offset, on_dead,
+                                                         dead_letters)
+        attempts += half_attempts
+        ok += half_ok
+        failed += half_failed
+    return attempts, ok, failed
+
+
+def batch_records(records, batch_size, linger):
+    """Group records into lists of up to batch_size.
+
+    A partial batch is flushed once its first record has waited linger seconds, so slow
+    sources such as a live generator still send promptly.
+    """
+    if linger <= 0:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        return
+
+    end = object()
+    pending = queue.Queue(maxsize=batch_size * 2)
+    failure = []
+
+    def read():
+        try:
+            for record in records:
+                pending.put(record)
+        except Exception as e:
+            failure.append(e)
+        finally:
+            pending.put(end)
+
+    threading.Thread(target=read, daemon=True).start()
+    batch = []
+    deadline = None
+    while True:
+        try:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            record = pending.get(timeout=timeout)
+        except queue.Empty:
+            yield batch
+            batch = []
+            continue
+        if record is end:
+            break
+        if not batch:
+            deadline = time.monotonic() + linger
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+    if failure:
+        raise failure[0]
+
+
+def journaled_post(post, journal):
+    # Items are (row_numbers, payload); rows are acknowledged in the journal as requests succeed, and also
+    # once dead-lettered, since replay_dead_letters.py resends those and --resume must not
+    def post_item(url, headers, item, label, **options):
+        rows, payload = item
+
+        def ack(offset, count):
+            journal.ack(rows[offset:offset + count])
+
+        return post(url, headers, payload, label, on_ok=ack, on_dead=ack, **options)
+
+    post_item.wraps = post
+    return post_item
+
+
+def prepare_items(records, batch_size, linger, journal=None):
+    # Returns the items to send, the function that posts one item, and how many records an item holds.
+    # With a journal, records are (row_number, record) pairs
+    batch_size = config.SEND_BATCH_SIZE if batch_size is None else batch_size
+    linger = config.SEND_BATCH_LINGER if linger is None else linger
+    if batch_size > 1:
+        logger.info(f"Batching up to {batch_size} records per request ({config.SEND_BATCH_FORMAT}, linger {linger}s)")
+        batches = batch_records(records, batch_size, linger)
+        if journal:
+            items = (([row for row, _ in batch], [record for _, record in batch]) for batch in batches)
+            return items, journaled_post(post_batch, journal), lambda item: len(item[0])
+        return batches, post_batch, len
+    if journal:
+        items = (([row], record) for row, record in records)
+        return items, journaled_post(post_record, journal), lambda item: 1
+    return records, post_record, lambda record: 1
+
+
+def send_records(records, url, headers, label="record", workers=None, rate=None, max_in_flight=None,
+                 batch_size=None, linger=None, stats=None, journal=None, dead_letters=None):
+    # dead_letters: file for records that still fail, instead of SEND_DEAD_LETTER
+    workers = workers or config.SEND_WORKERS
+    limiter = build_rate_limiter(rate)
+    max_in_flight = max(max_in_flight or config.SEND_MAX_IN_FLIGHT, workers)
+    items, post, size_of = prepare_items(records, batch_size, linger, journal)
+    if dead_letters is not None:
+        post = partial(post, dead_letters=dead_letters)
+
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+    stats = SendStats() if stats is None else stats
+
+    def task(item):
+        try:
+            stats.add(*post(url, headers, item, label))
+        finally:
+            in_flight.release()
+
+    logger.info(f"Sending {label}s with {workers} workers, max {max_in_flight} in flight")
+    progress = track(label, stats)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for item in items:
+            if limiter:
+                limiter.acquire(size_of(item))
+            in_flight.acquire()
+            pool.submit(task, item)
+    progress.stop()
+    if journal:
+        journal.flush()
+    summary = stats.summary(time.perf_counter() - start)
+    report_stats(label, summary)
+    return summary
+
+
+def init_range_process(reports, initializer, initargs):
+    report_to(reports)
+    if initializer:
+        initializer(*initargs)
+
+
+def collect_reports(reports, forwarded):
+    while (report := reports.get()) is not None:
+        forwarded.update(*report)
+
+
+def send_ranges(worker, ranges, label="record", initializer=None, initargs=()):
+    """Run worker(start, stop) for each row range in its own process and report the combined stats.
+
+    worker must return the SendStats of its range, e.g. by passing stats= to send_records.
+    The processes forward their live stats here, so /metrics is served by this process for all of them.
+    """
+    logger.info(f"Sending {label}s from {len(ranges)} processes: {ranges}")
+    stats = SendStats()
+    forwarded = ForwardedStats()
+    reports = multiprocessing.SimpleQueue()
+    collector = threading.Thread(target=collect_reports, args=(reports, forwarded), name="metrics-collect", daemon=True)
+    collector.start()
+    expose(label, forwarded)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=len(ranges), initializer=init_range_process,
+                             initargs=(reports, initializer, initargs)) as pool:
+        for range_stats in pool.map(worker, *zip(*ranges)):
+            stats.merge(range_stats)
+    reports.put(None)
+    collector.join()
+    summary = stats.summary(time.perf_counter() - start)
+    report_stats(label, summary)
+    return summary
+
+
+async def _send_records_async(items, post, size_of, url, headers, label, concurrency, queue_size, limiter):
+    loop = asyncio.get_running_loop()
+    pending = asyncio.Queue(maxsize=queue_size)
+    stats = SendStats()
+    paused_until = 0.0
+
+    async def produce():
+        # put() blocks while the queue is full, so reading never runs ahead of sending
+        if post is post_batch or getattr(post, "wraps", None) is post_batch:
+            # Batching may wait on its linger timer, so pull batches off the event loop
+            iterator = iter(items)
+            while (item := await loop.run_in_executor(None, next, iterator, None)) is not None:
+                await pending.put(item)
+        else:
+            for item in items:
+                await pending.put(item)
+        for _ in range(concurrency):
+            await pending.put(None)
+
+    async def consume():
+        nonlocal paused_until
+        while True:
+            item = await pending.get()
+            if item is None:
+                return
+            delay = paused_until - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if limiter:
+                await limiter.acquire_async(size_of(item))
+            attempts, ok, failed = await loop.run_in_executor(executor, post, url, headers, item, label)
+            stats.add(attempts, ok, failed)
+            status = attempts[-1][0]
+            if status in config.SEND_BACKOFF_STATUS_CODES:
+                logger.warning(f"Ingest service returned {status}, pausing senders for {config.SEND_BACKOFF_SECONDS}s")
+                paused_until = max(paused_until, loop.time() + config.SEND_BACKOFF_SECONDS)
+
+    progress = track(label, stats)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        await asyncio.gather(produce(), *(consume() for _ in range(concurrency)))
+    progress.stop()
+    return stats.summary(time.perf_counter() - start)
+
+
+def send_records_async(records, url, headers, label="record", concurrency=None, queue_size=None, rate=None,
+                       batch_size=None, linger=None, journal=None):
+    concurrency = concurrency or config.SEND_CONCURRENCY
+    queue_size = queue_size or config.SEND_QUEUE_SIZE
+    limiter = build_rate_limiter(rate)
+    items, post, size_of = prepare_items(records, batch_size, linger, journal)
+    logger.info(f"Sending {label}s asynchronously with concurrency {concurrency}, queue size {queue_size}")
+    stats = asyncio.run(_send_records_async(items, post, size_of, url, headers, label, concurrency, queue_size, limiter))
+    if journal:
+        journal.flush()
+    report_stats(label, stats)
+    return stats
@@ -1,18 +1,62 @@
+import argparse
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import config
 from i_1_create_tenant import create_tenant
-from i_2_2_generate_customers import main as generate_data
+from i_2_1_generate_products import main as generate_products
+from i_2_2_generate_customers import main as generate_customers
+from i_2_3_generate_events import main as generate_events
 from i_3_register_schema import main as register_schema
 from i_4_validate_schema import main as validate_schema
 from i_5_send_customers import main as send_customers
 from i_6_send_events import main as send_events
 
-def main():
-    create_tenant()
-    generate_data()
-    register_schema()
-    validate_schema()
-    send_customers()
-    send_events()
+logger = config.logger
+
+# Runs every stage in one process. Stages hand tenant id, products, customer ids, field types and mappings to
+# the next stage in memory; the JSON files are still written so any stage can be rerun on its own.
+# Customer fields come from the tenant's existing schema, so with --overlap customers are sent in the background
+# while events are generated and the event schema is registered and applied; events are then sent alongside them.
+# Overlapping is the default only when os.cpu_count() > 1; on one CPU generation and sending compete for it.
+
+
+def timed(name, stage, *args):
+    start = time.perf_counter()
+    result = stage(*args)
+    logger.info(f"Stage {name} finished in {time.perf_counter() - start:.2f}s")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the whole pipeline against a new tenant")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--sequential", dest="overlap", action="store_false", default=None,
+                      help="run the stages one after another (the default on a single CPU)")
+    mode.add_argument("--overlap", dest="overlap", action="store_true",
+                      help="send customers while events are generated (the default with more than one CPU)")
+    args = parser.parse_args(argv)
+    overlap = (os.cpu_count() or 1) > 1 if args.overlap is None else args.overlap
+
+    start = time.perf_counter()
+    tenant_id = timed("create_tenant", create_tenant)
+    products, product_data = timed("generate_products", generate_products)
+    customer_data = timed("generate_customers", generate_customers, tenant_id)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="send-customers") as pool:
+        sending_customers = None
+        if overlap:
+            sending_customers = pool.submit(timed, "send_customers", send_customers, [], tenant_id)
+        mappings, variables = timed("generate_events", generate_events, tenant_id, products, product_data,
+                                    customer_data)
+        timed("register_schema", register_schema, tenant_id, variables, mappings)
+        timed("validate_schema", validate_schema, tenant_id)
+        if not overlap:
+            timed("send_customers", send_customers, [], tenant_id)
+        timed("send_events", send_events, [], tenant_id, variables)
+        if sending_customers:
+            sending_customers.result()
+    logger.info(f"Pipeline finished in {time.perf_counter() - start:.2f}s")
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,332 @@
+import bisect
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import config
+
+logger = config.logger
+
+# Upper bounds, in seconds, of the request latency histogram exposed on /metrics
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Percentiles come from a log-scale histogram whose buckets grow by this factor, so memory stays bounded
+# (a few hundred buckets between 1us and 100s) and reported percentiles are within 1% of the true value
+LATENCY_RESOLUTION = 1.02
+_LOG_RESOLUTION = math.log(LATENCY_RESOLUTION)
+
+# Seconds between the snapshots a send process forwards to its parent (see report_to)
+FORWARD_INTERVAL = 1.0
+
+# Stats of the sends running (or finished) in this process, by label, for /metrics
+_tracked = {}
+_tracked_lock = threading.Lock()
+_server = None
+# Set in send processes: a queue to the parent, which serves their combined stats on /metrics
+_reports = None
+
+
+def latency_bucket(latency):
+    return math.floor(math.log(max(latency, 1e-6)) / _LOG_RESOLUTION)
+
+
+def percentile(histogram, pct):
+    # histogram maps latency_bucket() to request counts; returns the geometric middle of the bucket
+    total = sum(histogram.values())
+    if not total:
+        return 0.0
+    rank = int(round(pct / 100 * (total - 1)))
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen > rank:
+            return math.exp((bucket + 0.5) * _LOG_RESOLUTION)
+
+
+def is_ok(status):
+    return status is not None and 200 <= status < 300
+
+
+class SendStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.latency_histogram = Counter()  # latency_bucket() -> requests, for percentiles
+        self.latency_max = 0.0
+        self.status_codes = Counter()
+        self.records_ok = 0
+        self.records_failed = 0
+        self.bytes_sent = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # the last bucket is +Inf
+
+    def add(self, attempts, ok, failed):
+        with self.lock:
+            for status, latency, size in attempts:
+                self.requests += 1
+                self.latency_histogram[latency_bucket(latency)] += 1
+                self.latency_max = max(self.latency_max, latency)
+                self.status_codes[status if status is not None else "error"] += 1
+                self.bytes_sent += size
+                self.latency_sum += latency
+                self.latency_buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            self.records_ok += ok
+            self.records_failed += failed
+
+    def merge(self, other):
+        with self.lock:
+            self.requests += other.requests
+            self.latency_histogram += other.latency_histogram
+            self.latency_max = max(self.latency_max, other.latency_max)
+            self.status_codes += other.status_codes
+            self.records_ok += other.records_ok
+            self.records_failed += other.records_failed
+            self.bytes_sent += other.bytes_sent
+            self.latency_sum += other.latency_sum
+            self.latency_buckets = [a + b for a, b in zip(self.latency_buckets, other.latency_buckets)]
+
+    def __getstate__(self):
+        # Worker processes send their stats back to the parent; the lock stays behind
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "records": self.records_ok + self.records_failed,
+                "records_ok": self.records_ok,
+                "records_failed": self.records_failed,
+                "bytes_sent": self.bytes_sent,
+                "status_codes": Counter(self.status_codes),
+                "latency_sum": self.latency_sum,
+                "latency_buckets": list(self.latency_buckets),
+                "latency_histogram": Counter(self.latency_histogram),
+            }
+
+    def summary(self, elapsed):
+        histogram = self.latency_histogram
+        ok = sum(count for status, count in self.status_codes.items() if status != "error" and is_ok(status))
+        records = self.records_ok + self.records_failed
+        return {
+            "sent": self.requests,
+            "ok": ok,
+            "failed": self.requests - ok,
+            "records": records,
+            "records_ok": self.records_ok,
+            "records_failed": self.records_failed,
+            "bytes_sent": self.bytes_sent,
+            "elapsed": elapsed,
+            "throughput": records / elapsed if elapsed else 0.0,
+            # A bucket's middle can lie past the slowest request, so percentiles are capped at max
+            "p50": min(percentile(histogram, 50), self.latency_max),
+            "p90": min(percentile(histogram, 90), self.latency_max),
+            "p95": min(percentile(histogram, 95), self.latency_max),
+            "p99": min(percentile(histogram, 99), self.latency_max),
+            "max": self.latency_max,
+            "status_codes": self.status_codes,
+        }
+
+
+def combine_snapshots(snapshots):
+    total = {"requests": 0, "records": 0, "records_ok": 0, "records_failed": 0, "bytes_sent": 0,
+             "status_codes": Counter(), "latency_sum": 0.0, "latency_buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+             "latency_histogram": Counter()}
+    for snap in snapshots:
+        for key in ("requests", "records", "records_ok", "records_failed", "bytes_sent", "latency_sum",
+                    "status_codes", "latency_histogram"):
+            total[key] += snap[key]
+        total["latency_buckets"] = [a + b for a, b in zip(total["latency_buckets"], snap["latency_buckets"])]
+    return total
+
+
+class ForwardedStats:
+    """The stats send processes forward to the parent, combined; snapshot() stands in for SendStats'."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latest = {}  # sender -> its last snapshot
+
+    def update(self, sender, snapshot):
+        with self.lock:
+            self.latest[sender] = snapshot
+
+    def snapshot(self):
+        with self.lock:
+            return combine_snapshots(list(self.latest.values()))
+
+
+class SnapshotForwarder:
+    """Puts (sender, snapshot) on the parent's queue every FORWARD_INTERVAL seconds and once more on stop()."""
+
+    def __init__(self, stats, reports):
+        self.stats = stats
+        self.reports = reports
+        self.sender = (os.getpid(), id(stats))
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-forward", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.reports.put((self.sender, self.stats.snapshot()))
+
+    def _run(self):
+        while not self._stopped.wait(FORWARD_INTERVAL):
+            self.reports.put((self.sender, self.stats.snapshot()))
+
+
+def report_to(reports):
+    # Called in each send process; its tracked stats are forwarded to the parent through reports
+    global _reports
+    _reports = reports
+
+
+def report_stats(label, stats):
+    logger.info(
+        f"Sent {stats['records']} {label}s in {stats['sent']} requests over {stats['elapsed']:.2f}s "
+        f"({stats['throughput']:.1f} {label}s/s), delivered={stats['records_ok']} failed={stats['records_failed']}, "
+        f"{stats['bytes_sent'] / 1e6:.1f} MB sent"
+    )
+    logger.info(
+        f"Latency p50={stats['p50'] * 1000:.1f}ms p90={stats['p90'] * 1000:.1f}ms "
+        f"p95={stats['p95'] * 1000:.1f}ms p99={stats['p99'] * 1000:.1f}ms max={stats['max'] * 1000:.1f}ms"
+    )
+    logger.info(f"Status codes: {dict(stats['status_codes'])}")
+
+
+class ProgressReporter:
+    """Logs a progress line for one send every METRICS_INTERVAL seconds.
+
+    Rates and latency percentiles cover the last interval; errors and bytes are running totals.
+    """
+
+    def __init__(self, label, stats, interval=None):
+        self.label = label
+        self.stats = stats
+        self.interval = config.METRICS_INTERVAL if interval is None else interval
+        self.forwarder = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"progress-{label}", daemon=True)
+
+    def start(self):
+        if self.interval > 0:
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self.forwarder:
+            self.forwarder.stop()
+
+    def _run(self):
+        previous = self.stats.snapshot()
+        previous_time = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            current = self.stats.snapshot()
+            now = time.perf_counter()
+            elapsed = now - previous_time
+            # The interval's latencies are the difference between the two snapshots' histograms
+            latencies = current["latency_histogram"] - previous["latency_histogram"]
+            errors = {status: count for status, count in current["status_codes"].items() if not is_ok(status)}
+            logger.info(
+                f"[{self.label}] {current['records']} records "
+                f"({(current['records'] - previous['records']) / elapsed:.1f}/s), "
+                f"{(current['requests'] - previous['requests']) / elapsed:.1f} req/s, "
+                f"p50={percentile(latencies, 50) * 1000:.1f}ms p95={percentile(latencies, 95) * 1000:.1f}ms "
+                f"p99={percentile(latencies, 99) * 1000:.1f}ms, errors={errors}, "
+                f"{current['bytes_sent'] / 1e6:.1f} MB sent"
+            )
+            previous, previous_time = current, now
+
+
+def expose(label, stats):
+    """Serve stats (a SendStats or ForwardedStats) on /metrics under label."""
+    with _tracked_lock:
+        _tracked[label] = stats
+    start_metrics_server()
+
+
+def track(label, stats):
+    """Expose stats on /metrics and start its progress line; stop() the returned reporter when done.
+
+    In a send process started by ingest.send_ranges, the stats are also forwarded to the parent.
+    """
+    expose(label, stats)
+    reporter = ProgressReporter(label, stats).start()
+    if _reports is not None:
+        reporter.forwarder = SnapshotForwarder(stats, _reports).start()
+    return reporter
+
+
+def render_metrics():
+    lines = [
+        "# HELP cdp_send_requests_total Ingest requests by HTTP status, error when no response arrived.",
+        "# TYPE cdp_send_requests_total counter",
+    ]
+    with _tracked_lock:
+        snapshots = {label: stats.snapshot() for label, stats in _tracked.items()}
+    for label, snap in snapshots.items():
+        for status, count in sorted(snap["status_codes"].items(), key=str):
+            lines.append(f'cdp_send_requests_total{{label="{label}",status="{status}"}} {count}')
+    lines += ["# HELP cdp_send_records_total Records sent, by outcome.", "# TYPE cdp_send_records_total counter"]
+    for label, snap in snapshots.items():
+        lines.append(f'cdp_send_records_total{{label="{label}",result="ok"}} {snap["records_ok"]}')
+        lines.append(f'cdp_send_records_total{{label="{label}",result="failed"}} {snap["records_failed"]}')
+    lines += ["# HELP cdp_send_bytes_total Request body bytes sent.", "# TYPE cdp_send_bytes_total counter"]
+    for label, snap in snapshots.items():
+        lines.append(f'cdp_send_bytes_total{{label="{label}"}} {snap["bytes_sent"]}')
+    lines += ["# HELP cdp_send_request_duration_seconds Ingest request latency.",
+              "# TYPE cdp_send_request_duration_seconds histogram"]
+    for label, snap in snapshots.items():
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), snap["latency_buckets"]):
+            cumulative += count
+            lines.append(f'cdp_send_request_duration_seconds_bucket{{label="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'cdp_send_request_duration_seconds_sum{{label="{label}"}} {snap["latency_sum"]}')
+        lines.append(f'cdp_send_request_duration_seconds_count{{label="{label}"}} {snap["requests"]}')
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server():
+    # Serves /metrics on METRICS_PORT from the main process; worker processes only log progress
+    global _server
+    if not config.METRICS_PORT or _server is not None or multiprocessing.parent_process() is not None:
+        return
+    try:
+        _server = ThreadingHTTPServer((config.METRICS_HOST, config.METRICS_PORT), MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Cannot serve metrics on port {config.METRICS_PORT}: {e}")
+        _server = False
+        return
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Serving metrics on http://{config.METRICS_HOST}:{config.METRICS_PORT}/metrics")
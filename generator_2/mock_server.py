@@ -0,0 +1,218 @@
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Local stand-in for the CDP tenant, schema and ingest services. Point the pipeline at it with
+# CDP_BASE_URL=http://127.0.0.1:8080 and read the received counts from GET /stats.
+# Tenants live in memory: new ones start from DEFAULT_SCHEMA, draft fields are registered with
+# .../fields/draft and become part of /info once the draft schema is applied.
+
+received = Counter()
+lock = threading.Lock()
+tenants = {}
+tenant_ids = itertools.count(1)
+
+# Draft dtypes as registered by i_3_register_schema.py, mapped to the types /info reports
+DTYPES = {"BIGINT": "bigint", "DOUBLE": "double", "BOOL": "boolean", "DATETIME": "datetime", "DATE": "date"}
+SCHEMA_KINDS = {"customers": "customerFields", "events": "eventFields", "products": "productFields"}
+
+
+def schema_field(name, field_type, nullable=True, builtin=False, size=None):
+    if field_type == "varchar" and size is None:
+        size = 100
+    return {"name": name, "type": field_type, "nullable": nullable, "size": size, "flags": {"tableBuildIn": builtin}}
+
+
+DEFAULT_SCHEMA = {
+    "customerFields": [
+        schema_field("primary_id", "bigint", nullable=False, builtin=True),
+        schema_field("first_name", "varchar"),
+        schema_field("last_name", "varchar"),
+        schema_field("gender", "varchar", size=10),
+        schema_field("birth_date", "date"),
+        schema_field("score", "double"),
+        schema_field("is_vip", "boolean"),
+        schema_field("created_at", "datetime", nullable=False, builtin=True),
+    ],
+    "eventFields": [
+        schema_field("event_type", "varchar", nullable=False, builtin=True),
+        schema_field("primary_id", "bigint", nullable=False, builtin=True),
+        schema_field("created_at", "datetime", nullable=False, builtin=True),
+        schema_field("offset", "bigint", nullable=False, builtin=True),
+        schema_field("partition_id", "bigint", nullable=False, builtin=True),
+        schema_field("session_id", "varchar"),
+        schema_field("user_id", "varchar"),
+        schema_field("device_type", "varchar"),
+        schema_field("platform", "varchar"),
+        schema_field("product_id", "varchar"),
+        schema_field("price", "double"),
+        schema_field("quantity", "bigint"),
+        schema_field("currency", "varchar"),
+        schema_field("payment_method", "varchar"),
+        schema_field("page_url", "varchar"),
+    ],
+    "productFields": [],
+}
+
+
+def new_tenant(name):
+    return {"name": name, **json.loads(json.dumps(DEFAULT_SCHEMA)), "drafts": [], "mappings": {}}
+
+
+def get_tenant(tenant_id):
+    # Unknown ids get a fresh tenant, so a tenant.json from an earlier server run keeps working
+    with lock:
+        if tenant_id not in tenants:
+            tenants[tenant_id] = new_tenant(f"tenant-{tenant_id}")
+        return tenants[tenant_id]
+
+
+def parse_records(body, content_type):
+    text = body.decode("utf-8")
+    if "ndjson" in content_type:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    data = json.loads(text)
+    return data if isinstance(data, list) else [data]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; with Nagle on, keep-alive clients wait ~40ms per request
+    disable_nagle_algorithm = True
+    options = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, etag=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self, body):
+        return json.loads(body.decode("utf-8")) if body else {}
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with lock:
+                return self.send_json(200, dict(received))
+        if match := re.fullmatch(r"/api/tenants/([^/]+)/info", self.path):
+            tenant = get_tenant(match[1])
+            with lock:
+                info = {kind: tenant[kind] for kind in SCHEMA_KINDS.values()}
+            etag = '"%s"' % hashlib.sha1(json.dumps(info, sort_keys=True).encode("utf-8")).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                return self.end_headers()
+            return self.send_json(200, info, etag=etag)
+        if match := re.fullmatch(r"/api/tenants/([^/]+)/schema/events/field-mappings", self.path):
+            tenant = get_tenant(match[1])
+            with lock:
+                return self.send_json(200, {"mappings": tenant["mappings"]})
+        self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.options.latency:
+            time.sleep(self.options.latency)
+        if "/cdp-ignest/ingest/tenant/" in self.path:
+            return self.ingest(body)
+        try:
+            payload = self.read_json(body)
+        except ValueError as e:
+            return self.send_json(400, {"error": f"Invalid body: {e}"})
+
+        if self.path == "/api/tenants":
+            tenant_id = next(tenant_ids)
+            with lock:
+                tenants[str(tenant_id)] = new_tenant(payload.get("name", f"tenant-{tenant_id}"))
+            return self.send_json(200, {"tenant": {"tenantId": tenant_id, "name": tenants[str(tenant_id)]["name"]}})
+        if match := re.fullmatch(r"/api/tenants/([^/]+)/schema/(customers|events|products)/fields/draft", self.path):
+            return self.register_draft(get_tenant(match[1]), SCHEMA_KINDS[match[2]], payload)
+        if match := re.fullmatch(r"/api/tenants/([^/]+)/schema/events/field-mappings", self.path):
+            tenant = get_tenant(match[1])
+            with lock:
+                for event, fields in payload.get("mappings", {}).items():
+                    known = tenant["mappings"].setdefault(event, [])
+                    known += [f for f in fields if f not in known]
+            return self.send_json(200, {"mappings": tenant["mappings"]})
+        if match := re.fullmatch(r"/api/tenants/([^/]+)/plan/apply/draft-schema", self.path):
+            tenant = get_tenant(match[1])
+            with lock:
+                for kind, field in tenant["drafts"]:
+                    tenant[kind].append(field)
+                applied, tenant["drafts"] = len(tenant["drafts"]), []
+            return self.send_json(200, {"applied": applied})
+        self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def register_draft(self, tenant, kind, payload):
+        name, dtype = payload.get("name"), payload.get("dtype", "")
+        if not name or not dtype:
+            return self.send_json(400, {"error": "name and dtype are required"})
+        with lock:
+            existing = {f["name"] for f in tenant[kind]} | {f["name"] for k, f in tenant["drafts"] if k == kind}
+            if name in existing:
+                return self.send_json(409, {"error": f"Field {name} already exists"})
+            tenant["drafts"].append((kind, schema_field(name, DTYPES.get(dtype, "varchar"))))
+            received["draft_fields"] += 1
+        self.send_json(200, {"name": name, "dtype": dtype})
+
+    def ingest(self, body):
+        kind = self.path.rstrip("/").rsplit("/", 1)[1]
+        if self.options.error_rate and random.random() < self.options.error_rate:
+            with lock:
+                received[f"{kind}_injected_errors"] += 1
+            return self.send_json(self.options.error_status, {"error": "Injected failure"})
+        try:
+            records = parse_records(body, self.headers.get("Content-Type", ""))
+        except ValueError as e:
+            return self.send_json(400, {"error": f"Invalid body: {e}"})
+        if self.options.max_batch and len(records) > self.options.max_batch:
+            with lock:
+                received[f"{kind}_rejected_batches"] += 1
+            return self.send_json(413, {"error": f"Batch of {len(records)} exceeds {self.options.max_batch}"})
+        with lock:
+            received[f"{kind}_requests"] += 1
+            received[f"{kind}_records"] += len(records)
+        self.send_json(200, {"status": "ok", "accepted": len(records)})
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Local stand-in for the CDP tenant, schema and ingest services")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every POST")
+    parser.add_argument("--max-batch", type=int, default=0, help="reject larger batches with 413 (0 = no limit)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of ingest requests that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="status returned by injected failures")
+    return parser
+
+
+def make_server(options):
+    Handler.options = options
+    return ThreadingHTTPServer((options.host, options.port), Handler)
+
+
+def main():
+    options = build_parser().parse_args()
+    server = make_server(options)
+    print(f"Mock CDP listening on http://{options.host}:{options.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+import config
+
+logger = config.logger
+
+# How long to wait before re-checking a profile that currently allows no traffic
+IDLE_POLL_SECONDS = 0.05
+
+
+def constant_profile(rate):
+    return lambda elapsed: rate
+
+
+def linear_ramp_profile(start_rate, end_rate, duration):
+    def rate_at(elapsed):
+        if elapsed >= duration:
+            return end_rate
+        return start_rate + (end_rate - start_rate) * elapsed / duration
+    return rate_at
+
+
+def step_profile(start_rate, step, interval, max_rate=None):
+    def rate_at(elapsed):
+        rate = start_rate + step * int(elapsed // interval)
+        return min(rate, max_rate) if max_rate else rate
+    return rate_at
+
+
+def spike_profile(base_rate, peak_rate, at, duration):
+    def rate_at(elapsed):
+        return peak_rate if at <= elapsed < at + duration else base_rate
+    return rate_at
+
+
+PROFILES = {
+    "constant": constant_profile,
+    "ramp": linear_ramp_profile,
+    "step": step_profile,
+    "spike": spike_profile,
+}
+
+
+def parse_profile(spec, default_rate):
+    """Parse "name:arg:arg..." e.g. "ramp:10:500:60" or "spike:50:1000:30:10"."""
+    if not spec:
+        return constant_profile(default_rate)
+    name, *args = spec.split(":")
+    if name not in PROFILES:
+        raise ValueError(f"Unknown rate profile: {name}. Expected one of {', '.join(PROFILES)}")
+    return PROFILES[name](*(float(a) for a in args)) if args else PROFILES[name](default_rate)
+
+
+class TokenBucket:
+    def __init__(self, rate_at, burst=1):
+        self.rate_at = rate_at
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._start = self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        # Take tokens, going into debt if needed; returns seconds to wait, or None if the rate is currently zero
+        with self._lock:
+            now = time.monotonic()
+            rate = self.rate_at(now - self._start)
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * rate)
+            self._last = now
+            if rate <= 0:
+                return None
+            self._tokens -= tokens
+            return -self._tokens / rate if self._tokens < 0 else 0.0
+
+    def acquire(self, tokens=1):
+        while True:
+            wait = self.reserve(tokens)
+            if wait is None:
+                time.sleep(IDLE_POLL_SECONDS)
+                continue
+            if wait:
+                time.sleep(wait)
+            return
+
+    async def acquire_async(self, tokens=1):
+        while True:
+            wait = self.reserve(tokens)
+            if wait is None:
+                await asyncio.sleep(IDLE_POLL_SECONDS)
+                continue
+            if wait:
+                await asyncio.sleep(wait)
+            return
+
+
+def build_rate_limiter(rate=None, burst=None, profile=None):
+    rate = config.SEND_RATE if rate is None else rate
+    burst = config.SEND_BURST if burst is None else burst
+    profile = config.SEND_RATE_PROFILE if profile is None else profile
+    if not profile and not rate:
+        logger.info("Rate limiting disabled")
+        return None
+    if profile:
+        logger.info(f"Rate limiting with profile '{profile}' (burst {burst})")
+    else:
+        logger.info(f"Rate limiting at {rate}/s (burst {burst})")
+    return TokenBucket(parse_profile(profile, rate), burst)
@@ -0,0 +1,70 @@
+import json
+import struct
+import config
+
+logger = config.logger
+
+# Typed record stream, the binary alternative to write_csv_with_types:
+#   MAGIC, a header frame {"fieldnames": [...]}, then one frame per record holding an array
+#   of its values in fieldnames order (missing fields are stored as null).
+# A frame is a 4-byte little-endian length followed by UTF-8 JSON, so ints, floats, bools and
+# None come back as they were generated, senders need no re-parsing, and reading a file never
+# runs code. Rows are returned as tuples.
+MAGIC = b"CDPREC2\n"
+FRAME_HEADER = struct.Struct("<I")
+EXTENSION = ".rec"
+
+
+def encode_frame(value):
+    payload = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def decode_value(payload):
+    return json.loads(payload)
+
+
+def decode_row(payload):
+    return tuple(json.loads(payload))
+
+
+def read_frame(f, decode=decode_value):
+    header = f.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    return decode(f.read(length))
+
+
+def read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{getattr(f, 'name', 'file')} is not a record stream")
+    return read_frame(f)
+
+
+def write_records(data, filename, fieldnames):
+    logger.info(f"Writing data to {filename}")
+    with open(filename, "wb") as f:
+        f.write(MAGIC)
+        f.write(encode_frame({"fieldnames": list(fieldnames)}))
+        for row in data:
+            f.write(encode_frame([row.get(name) for name in fieldnames]))
+    logger.info(f"Completed writing to {filename}")
+
+
+def read_fieldnames(filename):
+    with open(filename, "rb") as f:
+        return read_header(f)["fieldnames"]
+
+
+def read_rows(filename):
+    with open(filename, "rb") as f:
+        read_header(f)
+        while (row := read_frame(f, decode_row)) is not None:
+            yield row
+
+
+def read_records(filename):
+    fieldnames = read_fieldnames(filename)
+    for row in read_rows(filename):
+        yield dict(zip(fieldnames, row))
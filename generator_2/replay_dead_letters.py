@@ -0,0 +1,45 @@
+import argparse
+import os
+import shutil
+from collections import defaultdict
+import config
+from dead_letter import read_dead_letters
+from ingest import send_records
+
+logger = config.logger
+
+headers = {"Content-Type": "application/json"}
+if config.AUTH_TOKEN:
+    headers["Authorization"] = config.AUTH_TOKEN
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resend records from a dead-letter file")
+    parser.add_argument("path", nargs="?", default=config.SEND_DEAD_LETTER)
+    args = parser.parse_args(argv)
+    # Records that fail again are written to the dead-letter file anew, so replay a moved-aside copy.
+    # A copy left by an interrupted replay is replayed again, together with any newer dead letters.
+    replaying = args.path + ".replaying" if args.path else ""
+    if not args.path or not (os.path.exists(args.path) or os.path.exists(replaying)):
+        logger.info(f"No dead letters to replay at {args.path}")
+        return
+    if os.path.exists(replaying):
+        logger.warning(f"Resuming the interrupted replay in {replaying}")
+        if os.path.exists(args.path):
+            with open(args.path, "rb") as new, open(replaying, "ab") as pending:
+                shutil.copyfileobj(new, pending)
+            os.remove(args.path)
+    else:
+        os.replace(args.path, replaying)
+    groups = defaultdict(list)
+    for letter in read_dead_letters(replaying):
+        groups[(letter["url"], letter["label"])].append(letter["record"])
+    for (url, label), records in groups.items():
+        logger.info(f"Replaying {len(records)} {label}s to {url}")
+        send_records(records, url, headers, label=label, dead_letters=args.path)
+    os.remove(replaying)
+    logger.info("Completed replaying dead letters")
+
+
+if __name__ == "__main__":
+    main()
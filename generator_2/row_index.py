@@ -0,0 +1,145 @@
+import csv
+import io
+import mmap
+import os
+from array import array
+import config
+import records
+
+logger = config.logger
+
+# A row-offset index sits next to each data file as <file>.idx: the byte offset where every row
+# starts followed by the end of the data, as unsigned 64-bit ints in native byte order.
+# Row i of the file is bytes offsets[i]:offsets[i + 1], so any row range can be read without
+# scanning the rows before it.
+INDEX_SUFFIX = ".idx"
+CSV_BLOCK_ROWS = 10000  # CSV rows decoded per slice of the mapped file
+
+
+def index_path(filename):
+    return filename + INDEX_SUFFIX
+
+
+def scan_offsets(filename):
+    offsets = array("Q")
+    with open(filename, "rb") as f:
+        if filename.endswith(records.EXTENSION):
+            records.read_header(f)
+            position = f.tell()
+            while size := f.read(records.FRAME_HEADER.size):
+                offsets.append(position)
+                position += records.FRAME_HEADER.size + records.FRAME_HEADER.unpack(size)[0]
+                f.seek(position)
+        else:
+            position = len(f.readline())
+            quoted = False
+            for line in f:
+                # A quoted field may span lines; a row only starts outside quotes
+                if not quoted:
+                    offsets.append(position)
+                if line.count(b'"') % 2:
+                    quoted = not quoted
+                position += len(line)
+    offsets.append(position)
+    return offsets
+
+
+def write_index(filename, offsets):
+    with open(index_path(filename), "wb") as f:
+        offsets.tofile(f)
+
+
+def build_index(filename):
+    offsets = scan_offsets(filename)
+    write_index(filename, offsets)
+    return offsets
+
+
+def load_index(filename):
+    # Rebuilds the index when it is missing or does not end where the data file ends
+    path = index_path(filename)
+    if os.path.exists(path):
+        offsets = array("Q")
+        with open(path, "rb") as f:
+            offsets.frombytes(f.read())
+        if offsets and offsets[-1] == os.path.getsize(filename):
+            return offsets
+    logger.info(f"Indexing rows of {filename}")
+    return build_index(filename)
+
+
+def remove_index(filename):
+    path = index_path(filename)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class IndexedFile:
+    """Random access to the rows of one data file through its row-offset index.
+
+    CSV rows come back as dicts of strings like csv.DictReader, record stream rows as value tuples.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.typed = filename.endswith(records.EXTENSION)
+        self.offsets = load_index(filename)
+        with open(filename, "rb") as f:
+            if self.typed:
+                self.fieldnames = records.read_header(f)["fieldnames"]
+            else:
+                self.fieldnames = next(csv.reader([f.readline().decode("utf-8")]))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def rows(self, start=0, stop=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return
+        offsets = self.offsets
+        with open(self.filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if self.typed:
+                skip = records.FRAME_HEADER.size
+                for i in range(start, stop):
+                    yield records.decode_row(data[offsets[i] + skip:offsets[i + 1]])
+                return
+            for block in range(start, stop, CSV_BLOCK_ROWS):
+                text = data[offsets[block]:offsets[min(block + CSV_BLOCK_ROWS, stop)]].decode("utf-8")
+                yield from csv.DictReader(io.StringIO(text, newline=""), fieldnames=self.fieldnames)
+
+
+class Dataset:
+    """The rows of a generated dataset, merged or still in shard parts, numbered across all files."""
+
+    def __init__(self, filenames):
+        self.filenames = list(filenames)
+        self.files = [IndexedFile(filename) for filename in self.filenames]
+        self.typed = self.files[0].typed
+        self.fieldnames = self.files[0].fieldnames
+        self.starts = [0]
+        for indexed in self.files:
+            self.starts.append(self.starts[-1] + len(indexed))
+
+    def __len__(self):
+        return self.starts[-1]
+
+    def rows(self, start=0, stop=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        for indexed, first in zip(self.files, self.starts):
+            if first + len(indexed) <= start:
+                continue
+            if first >= stop:
+                break
+            yield from indexed.rows(max(start - first, 0), stop - first)
+
+    def rows_in(self, ranges):
+        # (row_number, row) for every row in the given (start, stop) ranges
+        for start, stop in ranges:
+            yield from enumerate(self.rows(start, stop), start)
+
+    def split(self, count, start=0):
+        # Contiguous row ranges of near-equal size covering rows start..len
+        total = len(self) - start
+        bounds = [start + total * i // count for i in range(count + 1)]
+        return [(low, high) for low, high in zip(bounds, bounds[1:]) if high > low]
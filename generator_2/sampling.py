@@ -0,0 +1,81 @@
+import random
+from functools import partial
+
+# Popularity samplers for customers, products and event types, configured by a spec string:
+#   uniform              every item equally likely
+#   zipf[:S]             the k-th item has weight 1 / k**S (S defaults to 1)
+#   histogram:W1,W2,...  the items are cut into len(W) equal rank buckets that share each weight
+#   histogram:A=W1,B=W2  weights by item name, for small named sets such as event types
+# Non-uniform specs draw from a precomputed alias table, one random() call per draw.
+
+
+class AliasSampler:
+    """Draws items with the given weights in O(1) using Vose's alias method."""
+
+    def __init__(self, items, weights):
+        n = len(items)
+        total = sum(weights)
+        if n == 0 or n != len(weights) or total <= 0:
+            raise ValueError("An alias table needs one weight per item and a positive total")
+        scaled = [weight * n / total for weight in weights]
+        self.items = list(items)
+        self.n = n
+        self.prob = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s, g = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = g
+            scaled[g] -= 1 - scaled[s]
+            (small if scaled[g] < 1 else large).append(g)
+        # Whatever is left holds probability 1 up to rounding
+
+    def __call__(self):
+        # The integer part picks a column, the fraction decides between it and its alias
+        u = random.random() * self.n
+        i = int(u)
+        return self.items[i if u - i < self.prob[i] else self.alias[i]]
+
+
+def spec_weights(spec, items):
+    kind, _, argument = spec.partition(":")
+    if kind == "zipf":
+        exponent = float(argument or 1)
+        return [1 / (rank ** exponent) for rank in range(1, len(items) + 1)]
+    if kind == "histogram" and "=" in argument:
+        named = {name: float(weight) for name, weight in (pair.split("=") for pair in argument.split(","))}
+        unknown = set(named) - set(items)
+        if unknown:
+            raise ValueError(f"Unknown items in {spec}: {sorted(unknown)}")
+        return [named.get(item, 0.0) for item in items]
+    if kind == "histogram":
+        buckets = [float(weight) for weight in argument.split(",")]
+        ranks = [len(buckets) * k // len(items) for k in range(len(items))]
+        sizes = [ranks.count(bucket) for bucket in range(len(buckets))]
+        return [buckets[bucket] / sizes[bucket] for bucket in ranks]
+    raise ValueError(f"Unknown distribution {spec}; use uniform, zipf[:S] or histogram:...")
+
+
+def apportion(total, shares):
+    """Split total into integer counts proportional to shares (largest remainder method)."""
+    share_total = sum(shares)
+    exact = [total * share / share_total for share in shares]
+    counts = [int(x) for x in exact]
+    by_remainder = sorted(range(len(shares)), key=lambda i: counts[i] - exact[i])
+    for i in by_remainder[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def build_sampler(spec, items):
+    """Return a zero-argument callable that draws one of items according to spec."""
+    if spec == "uniform":
+        # random.choice keeps uniform datasets identical to those generated before samplers existed
+        return partial(random.choice, items)
+    return AliasSampler(items, spec_weights(spec, items))
+
+
+def spec_weights_or_uniform(spec, items):
+    return [1.0] * len(items) if spec == "uniform" else spec_weights(spec, items)
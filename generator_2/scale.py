@@ -0,0 +1,25 @@
+# TPC-style dataset sizing: one scale factor fixes every entity count, so datasets at different factors keep
+# the same shape (events per customer, customers per product, primary id density) and differ only in size.
+# SF=1 reproduces the historical defaults of 500 products, 30000 customers and 70000 events.
+# Deliberately free of config imports, so benchmark.py can size runs without loading a configuration.
+
+BASE_CUSTOMERS = 30000
+EVENTS_PER_CUSTOMER = 7 / 3
+CUSTOMERS_PER_PRODUCT = 60
+# primary_id values per customer; keeps the id range sparse enough for readable ids at any factor
+PRIMARY_ID_SPARSITY = 30
+PRIMARY_ID_START = 100000
+MIN_PRIMARY_IDS = 900000
+
+
+def scaled_sizes(scale_factor):
+    if scale_factor <= 0:
+        raise ValueError(f"Scale factor must be positive, got {scale_factor}")
+    customers = max(1, round(BASE_CUSTOMERS * scale_factor))
+    id_count = max(MIN_PRIMARY_IDS, customers * PRIMARY_ID_SPARSITY)
+    return {
+        "NUM_CUSTOMERS": customers,
+        "NUM_EVENTS": max(1, round(customers * EVENTS_PER_CUSTOMER)),
+        "NUM_PRODUCTS": max(1, round(customers / CUSTOMERS_PER_PRODUCT)),
+        "PRIMARY_ID_RANGE": [PRIMARY_ID_START, PRIMARY_ID_START + id_count - 1],
+    }
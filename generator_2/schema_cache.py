@@ -0,0 +1,81 @@
+import json
+import os
+import time
+import requests
+import config
+
+logger = config.logger
+
+# Local copy of /api/tenants/{id}/info, shared by the generators and schema registration:
+#   {tenant_id: {"fetched_at": epoch seconds, "etag": str or null, "info": <response body>}}
+# An entry younger than SCHEMA_CACHE_TTL is used without a request; an older one is revalidated
+# with If-None-Match when the server sent an ETag. Schema writes (draft registration, applying the
+# draft schema) invalidate the tenant's entry. If the API cannot be reached, a cached entry of any
+# age is used, so data can be regenerated offline; CDP_SCHEMA_OFFLINE=1 skips the network entirely.
+
+
+def _load(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        logger.warning(f"Ignoring unreadable schema cache {path}: {e}")
+        return {}
+
+
+def _save(path, entries):
+    # Write-then-rename so a concurrently reading stage never sees a partial file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entries, f)
+    os.replace(tmp, path)
+
+
+def fetch_tenant_info(base_url, tenant_id, path=None):
+    path = config.SCHEMA_CACHE if path is None else path
+    entries = _load(path) if path else {}
+    entry = entries.get(str(tenant_id))
+    if entry and (config.SCHEMA_OFFLINE or time.time() - entry["fetched_at"] < config.SCHEMA_CACHE_TTL):
+        logger.info(f"Using cached schema of tenant {tenant_id}")
+        return entry["info"]
+    if config.SCHEMA_OFFLINE:
+        raise Exception(f"No cached schema for tenant {tenant_id} and CDP_SCHEMA_OFFLINE is set")
+
+    url = f"{base_url}/api/tenants/{tenant_id}/info"
+    headers = {"If-None-Match": entry["etag"]} if entry and entry.get("etag") else None
+    logger.info(f"Fetching tenant schema from {url}")
+    try:
+        response = requests.get(url, headers=headers)
+    except requests.RequestException as e:
+        if not entry:
+            raise
+        logger.warning(f"Cannot reach {url} ({e}), using cached schema of tenant {tenant_id}")
+        return entry["info"]
+    config.handle_curl_debug("GET", url, headers=headers, data=None, response=response)
+    if response.status_code == 304 and entry:
+        logger.info(f"Cached schema of tenant {tenant_id} is current")
+    elif response.ok:
+        entry = {"etag": response.headers.get("ETag"), "info": response.json()}
+    else:
+        logger.error(f"Failed to fetch tenant schema: {response.status_code} {response.text}")
+        raise Exception(f"Failed to fetch tenant schema: {response.status_code} {response.text}")
+
+    if path:
+        entry["fetched_at"] = time.time()
+        # Reload so entries other stages wrote meanwhile are kept
+        entries = _load(path)
+        entries[str(tenant_id)] = entry
+        _save(path, entries)
+    return entry["info"]
+
+
+def invalidate(tenant_id, path=None):
+    path = config.SCHEMA_CACHE if path is None else path
+    if not path:
+        return
+    entries = _load(path)
+    if entries.pop(str(tenant_id), None) is not None:
+        _save(path, entries)
+        logger.info(f"Invalidated cached schema of tenant {tenant_id}")
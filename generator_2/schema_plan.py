@@ -0,0 +1,73 @@
+import random
+from functools import partial
+from utils import null_rate, BIGINT_RANGES, DEFAULT_BIGINT_RANGE, random_datetime
+from value_pools import pooled
+
+# Built-in columns the CDP fills in itself
+BUILTIN_FIELDS = ["created_at", "offset", "partition_id"]
+
+
+def _word(size):
+    return pooled("word")[:size] if size else pooled("word")
+
+
+def _double():
+    return round(random.uniform(10, 500), 2)
+
+
+def _boolean():
+    return random.choice([True, False])
+
+
+def _nullable(produce, rate):
+    def produce_or_none():
+        if random.random() < rate:
+            return None
+        return produce()
+    return produce_or_none
+
+
+def compile_field(field, named_producers, columns=None):
+    """Return a zero-argument callable producing one value for the field, null decision included.
+
+    named_producers maps (type, name) to a callable for fields that need special values.
+    Fields the columnar backend can generate are served from the ColumnBuffer instead.
+    """
+    name = field["name"]
+    field_type = field["type"]
+    if columns is not None and name in columns:
+        return partial(columns.take, name)
+
+    if (field_type, name) in named_producers:
+        produce = named_producers[(field_type, name)]
+    elif field_type == "bigint":
+        produce = partial(random.randint, *BIGINT_RANGES.get(name, DEFAULT_BIGINT_RANGE))
+    elif field_type == "varchar":
+        produce = partial(_word, field["size"])
+    elif field_type in ["date", "datetime"]:
+        produce = random_datetime
+    elif field_type == "double":
+        produce = _double
+    elif field_type == "boolean":
+        produce = _boolean
+    else:
+        raise ValueError(f"Unknown field type: {field_type}")
+    return _nullable(produce, null_rate(name)) if field["nullable"] else produce
+
+
+def compile_customer_plan(customer_fields, named_producers, columns=None):
+    return [(f["name"], compile_field(f, named_producers, columns)) for f in customer_fields
+            if not (f["name"] == "created_at" and f["flags"]["tableBuildIn"])]
+
+
+def compile_event_plans(event_fields, event_field_rules, named_producers, columns=None):
+    # One ordered (name, nullable, producer) list per event type, holding only the fields that type uses
+    plans = {}
+    for event_type, allowed_fields in event_field_rules.items():
+        plans[event_type] = [
+            (f["name"], f["nullable"], compile_field(f, named_producers, columns)) for f in event_fields
+            if not (f["name"] in BUILTIN_FIELDS and f["flags"]["tableBuildIn"])
+            and f["name"] not in ["event_type", "primary_id"]
+            and f["name"] in allowed_fields
+        ]
+    return plans
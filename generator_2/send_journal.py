@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import threading
+import time
+import config
+
+logger = config.logger
+
+# Acknowledged row ranges per tenant and dataset, so an interrupted send can resume with --resume
+# instead of resending (and duplicating) everything. Rows are numbered as in row_index.Dataset.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    tenant_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    PRIMARY KEY (tenant_id, name)
+);
+CREATE TABLE IF NOT EXISTS acked (
+    tenant_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS acked_dataset ON acked (tenant_id, name);
+"""
+FLUSH_ROWS = 5000
+FLUSH_SECONDS = 1.0
+
+
+def dataset_fingerprint(filenames):
+    # Regenerating the data changes sizes or mtimes, which makes older acknowledgements meaningless
+    return ";".join(f"{os.path.basename(f)}:{os.path.getsize(f)}:{os.stat(f).st_mtime_ns}" for f in filenames)
+
+
+def coalesce(ranges):
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return [(start, stop) for start, stop in merged]
+
+
+def rows_to_ranges(rows):
+    return coalesce((row, row + 1) for row in rows)
+
+
+def open_journal(tenant_id, name, filenames, resume):
+    # None when journaling is disabled
+    if not config.SEND_JOURNAL:
+        if resume:
+            logger.warning("--resume needs CDP_SEND_JOURNAL, sending everything")
+        return None
+    return SendJournal.open(config.SEND_JOURNAL, tenant_id, name, dataset_fingerprint(filenames), resume)
+
+
+class SendJournal:
+    """Thread-safe journal of the rows of one dataset the ingest service acknowledged.
+
+    Acknowledgements are buffered and written every FLUSH_ROWS rows or FLUSH_SECONDS, so a crash
+    loses at most that window, which is resent (not skipped) on resume.
+    """
+
+    def __init__(self, path, tenant_id, name):
+        self.path = path
+        self.key = (str(tenant_id), name)
+        self.lock = threading.Lock()
+        self.pending = []
+        self.flushed_at = time.monotonic()
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    @classmethod
+    def open(cls, path, tenant_id, name, fingerprint, resume):
+        """Open the journal for a new send; without resume, or when the data changed, start over."""
+        journal = cls(path, tenant_id, name)
+        with journal.lock, journal.db:
+            row = journal.db.execute("SELECT fingerprint FROM datasets WHERE tenant_id = ? AND name = ?",
+                                     journal.key).fetchone()
+            if resume and row and row[0] == fingerprint:
+                ranges = journal._acked_ranges()
+                journal.db.execute("DELETE FROM acked WHERE tenant_id = ? AND name = ?", journal.key)
+                journal.db.executemany("INSERT INTO acked VALUES (?, ?, ?, ?)",
+                                       [(*journal.key, start, stop) for start, stop in ranges])
+                logger.info(f"Resuming {name}: {sum(stop - start for start, stop in ranges)} rows already acknowledged")
+                return journal
+            if resume:
+                logger.warning(f"No journal matching the current {name}, sending everything")
+            journal.db.execute("DELETE FROM acked WHERE tenant_id = ? AND name = ?", journal.key)
+            journal.db.execute("INSERT OR REPLACE INTO datasets VALUES (?, ?, ?)", (*journal.key, fingerprint))
+        return journal
+
+    def _acked_ranges(self):
+        rows = self.db.execute("SELECT start, stop FROM acked WHERE tenant_id = ? AND name = ?", self.key).fetchall()
+        return coalesce(rows)
+
+    def pending_ranges(self, start, stop):
+        """Row ranges in start..stop that have not been acknowledged yet."""
+        with self.lock:
+            acked = self._acked_ranges()
+        ranges = []
+        for low, high in acked + [(stop, stop)]:
+            low, high = min(max(low, start), stop), min(high, stop)
+            if low > start:
+                ranges.append((start, low))
+            start = max(start, high)
+        return ranges
+
+    def ack(self, rows):
+        with self.lock:
+            self.pending.extend(rows)
+            if len(self.pending) >= FLUSH_ROWS or time.monotonic() - self.flushed_at >= FLUSH_SECONDS:
+                self._flush()
+
+    def _flush(self):
+        if self.pending:
+            with self.db:
+                self.db.executemany("INSERT INTO acked VALUES (?, ?, ?, ?)",
+                                    [(*self.key, start, stop) for start, stop in rows_to_ranges(self.pending)])
+            self.pending = []
+        self.flushed_at = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        self.flush()
+        self.db.close()
@@ -0,0 +1,90 @@
+import heapq
+import itertools
+import math
+import random
+from datetime import datetime, timezone
+import config
+from utils import random_uuid
+
+# Session simulation for i_2_3_generate_events.py with CDP_EVENT_MODE=sessions. Sessions start as a
+# Poisson process whose rate follows a daily curve peaking at SESSION_PEAK_HOUR (UTC); each session walks
+# SESSION_FLOW from "start" to "end" with exponential gaps between its events. Open sessions wait in a heap
+# keyed by their next event time, so events come out in time order without holding more than the open
+# sessions in memory.
+
+# Generated-only column with each event's time; not registered with the tenant nor sent
+EVENT_TIME_FIELD = "event_time"
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+# Weights of the next event type, by current event type
+SESSION_FLOW = {
+    "start": {"login": 0.3, "page_view": 0.6, "search": 0.1},
+    "login": {"page_view": 0.7, "search": 0.3},
+    "page_view": {"page_view": 0.45, "search": 0.15, "add_to_cart": 0.15, "logout": 0.05, "end": 0.2},
+    "search": {"page_view": 0.5, "search": 0.15, "add_to_cart": 0.15, "end": 0.2},
+    "add_to_cart": {"page_view": 0.3, "add_to_cart": 0.1, "purchase": 0.35, "end": 0.25},
+    "purchase": {"page_view": 0.3, "logout": 0.2, "end": 0.5},
+    "logout": {"end": 1.0},
+}
+_TRANSITIONS = {state: (list(weights), list(itertools.accumulate(weights.values())))
+                for state, weights in SESSION_FLOW.items()}
+
+
+def next_event_type(event_type):
+    states, cumulative = _TRANSITIONS[event_type]
+    return random.choices(states, cum_weights=cumulative)[0]
+
+
+def mean_session_length(iterations=200):
+    # Expected events per session: L(s) = 1 + sum of p(s, t) * L(t), solved by iteration ("start" is no event)
+    lengths = dict.fromkeys(SESSION_FLOW, 0.0)
+    for _ in range(iterations):
+        lengths = {state: (state != "start") + sum(w * lengths.get(t, 0.0) for t, w in weights.items()) / sum(weights.values())
+                   for state, weights in SESSION_FLOW.items()}
+    return lengths["start"]
+
+
+def intensity(timestamp):
+    # Relative session arrival rate at this time of day; averages 1 over a day
+    hour = (timestamp % 86400) / 3600
+    return 1 + config.SESSION_DIURNAL_AMPLITUDE * math.cos(2 * math.pi * (hour - config.SESSION_PEAK_HOUR) / 24)
+
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime(TIME_FORMAT)
+
+
+def parse_time(value):
+    return datetime.strptime(value, TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+
+
+def simulate_sessions(count, pick_customer, start, end):
+    """Yield (timestamp, customer_id, session_id, event_type) for count events, in time order.
+
+    pick_customer draws the customer of each new session (see sampling.py); None draws random ids.
+    The session rate spreads count events over start..end (epoch seconds) on average, so the last
+    events can land a little before or after end.
+    """
+    if count <= 0:
+        return
+    rate = count / (mean_session_length() * (end - start))
+    # Arrivals are drawn at the peak rate and thinned down to the daily curve
+    peak = 1 + config.SESSION_DIURNAL_AMPLITUDE
+    open_sessions = []  # (next event time, tiebreak, customer_id, session_id, event_type)
+    tiebreak = itertools.count()
+    arrival = start + random.expovariate(rate * peak)
+    emitted = 0
+    while emitted < count:
+        if open_sessions and open_sessions[0][0] <= arrival:
+            timestamp, _, customer_id, session_id, event_type = heapq.heappop(open_sessions)
+            yield timestamp, customer_id, session_id, event_type
+            emitted += 1
+            event_type = next_event_type(event_type)
+            if event_type != "end":
+                gap = random.expovariate(1 / config.SESSION_MEAN_GAP)
+                heapq.heappush(open_sessions, (timestamp + gap, next(tiebreak), customer_id, session_id, event_type))
+            continue
+        if random.random() * peak < intensity(arrival):
+            customer_id = pick_customer() if pick_customer else random.randint(100000, 999999)
+            heapq.heappush(open_sessions, (arrival, next(tiebreak), customer_id, random_uuid(), next_event_type("start")))
+        arrival += random.expovariate(rate * peak)
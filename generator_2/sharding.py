@@ -0,0 +1,131 @@
+import glob
+import hashlib
+import heapq
+import os
+import random
+import shutil
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+from faker import Faker
+import config
+import ids
+import records
+import row_index
+from utils import write_dataset
+
+logger = config.logger
+
+_master_seed = None
+
+
+def get_master_seed():
+    global _master_seed
+    if _master_seed is None:
+        _master_seed = config.GENERATION_SEED if config.GENERATION_SEED is not None else random.randrange(2 ** 32)
+        logger.info(f"Using generation seed {_master_seed} (set CDP_GENERATION_SEED to reproduce)")
+    return _master_seed
+
+
+def derive_seed(name, shard_index):
+    digest = hashlib.sha256(f"{get_master_seed()}:{name}:{shard_index}".encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def seed_generators(seed):
+    # Faker.seed seeds the random instance shared by every Faker() proxy; ids.reset drops UUIDs buffered under the old seed
+    random.seed(seed)
+    Faker.seed(seed)
+    ids.reset()
+
+
+def plan_shards(total, shard_size):
+    return [(index, min(shard_size, total - start)) for index, start in enumerate(range(0, total, shard_size))]
+
+
+def part_path(filename, shard_index):
+    root, ext = os.path.splitext(filename)
+    return f"{root}.part-{shard_index:05d}{ext}"
+
+
+def list_parts(filename):
+    root, ext = os.path.splitext(filename)
+    return sorted(glob.glob(f"{root}.part-*{ext}"))
+
+
+def input_files(filename):
+    # Senders read the merged file when present, otherwise the shard parts in order
+    if os.path.exists(filename):
+        return [filename]
+    parts = list_parts(filename)
+    if not parts:
+        raise FileNotFoundError(f"{filename} not found. Run generator first.")
+    return parts
+
+
+def clear_outputs(filename):
+    for path in list_parts(filename) + [filename]:
+        if os.path.exists(path):
+            os.remove(path)
+        row_index.remove_index(path)
+
+
+def read_part_header(part, filename):
+    # CSV parts start with a header line, record streams with MAGIC and a header frame
+    if not filename.endswith(records.EXTENSION):
+        return part.readline()
+    magic = part.read(len(records.MAGIC))
+    size = part.read(records.FRAME_HEADER.size)
+    return magic + size + part.read(records.FRAME_HEADER.unpack(size)[0])
+
+
+def merge_parts(filename, shard_count, order_by=None):
+    if order_by:
+        return merge_parts_ordered(filename, shard_count, order_by)
+    logger.info(f"Merging {shard_count} parts into {filename}")
+    offsets = array("Q")
+    with open(filename, "wb") as out:
+        for index in range(shard_count):
+            path = part_path(filename, index)
+            with open(path, "rb") as part:
+                header = read_part_header(part, filename)
+                if index == 0:
+                    out.write(header)
+                # The part's row offsets move by where its rows land in the merged file
+                shift = out.tell() - part.tell()
+                offsets.extend(offset + shift for offset in row_index.load_index(path)[:-1])
+                shutil.copyfileobj(part, out)
+            os.remove(path)
+            row_index.remove_index(path)
+        offsets.append(out.tell())
+    row_index.write_index(filename, offsets)
+    logger.info(f"Completed merging into {filename}")
+
+
+def merge_parts_ordered(filename, shard_count, key):
+    # Parts that are each sorted on the key column are merged row by row into one sorted file
+    logger.info(f"Merging {shard_count} parts into {filename} ordered by {key}")
+    paths = [part_path(filename, index) for index in range(shard_count)]
+    parts = [row_index.IndexedFile(path) for path in paths]
+    fieldnames = parts[0].fieldnames
+    streams = [(dict(zip(fieldnames, row)) for row in part.rows()) if part.typed else part.rows() for part in parts]
+    write_dataset(heapq.merge(*streams, key=itemgetter(key)), filename, fieldnames)
+    for path in paths:
+        os.remove(path)
+        row_index.remove_index(path)
+    logger.info(f"Completed merging into {filename}")
+
+
+def run_shards(worker, total, name, initializer=None, initargs=(), shards=None):
+    # Shard boundaries depend only on the shard size (or the given (index, count) plan), so the output does
+    # not depend on the process count
+    shards = shards or plan_shards(total, config.GENERATION_SHARD_SIZE)
+    processes = min(config.GENERATION_PROCESSES, len(shards))
+    logger.info(f"Generating {total} {name} in {len(shards)} shards on {max(processes, 1)} processes")
+    if processes <= 1:
+        if initializer:
+            initializer(*initargs)
+        return [worker(index, count, derive_seed(name, index)) for index, count in shards]
+    with ProcessPoolExecutor(max_workers=processes, initializer=initializer, initargs=initargs) as pool:
+        futures = [pool.submit(worker, index, count, derive_seed(name, index)) for index, count in shards]
+        return [future.result() for future in futures]
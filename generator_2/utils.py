@@ -1,7 +1,12 @@
 import csv
 import json
-import requests
+import random
+from datetime import datetime, timezone
 import config
+import ids
+import records
+import row_index
+import schema_cache
 from faker import Faker
 
 logger = config.logger
@@ -45,6 +50,25 @@ EVENT_FIELD_RULES = {
     "search": {"primary_id", "user_id", "session_id", "device_type", "platform"}
 }
 
+NULL_RATE = config.NULL_RATE
+# Inclusive ranges for bigint fields, by name
+BIGINT_RANGES = {
+    "primary_id": (100000, 999999),
+    "offset": (0, 1000),
+    "partition_id": (0, 1000),
+    "quantity": (1, 10),
+    **{name: tuple(bounds) for name, bounds in config.BIGINT_RANGES.items()},
+}
+DEFAULT_BIGINT_RANGE = (0, 10000)
+
+# Like fake.date_time_this_year(), but bounded by a fixed day so seeded runs are reproducible
+_reference_date = (datetime.strptime(config.GENERATION_REFERENCE_DATE, "%Y-%m-%d") if config.GENERATION_REFERENCE_DATE
+                   else datetime.now(timezone.utc)).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc)
+DATE_RANGE = (_reference_date.replace(month=1, day=1).timestamp(), _reference_date.timestamp())
+
+def null_rate(name):
+    return config.NULL_RATES.get(name, NULL_RATE)
+
 def infer_dtype(value):
     if isinstance(value, bool):
         return "BOOL"
@@ -57,6 +81,13 @@ def infer_dtype(value):
             return "DATETIME"
     return "VARCHAR_1000"
 
+def random_uuid():
+    # uuid4() reads os.urandom; blocks of seeded random bytes (see ids.py) keep datasets reproducible
+    return ids.next_uuid()
+
+def random_datetime():
+    return datetime.fromtimestamp(random.uniform(*DATE_RANGE), tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
 def write_csv_with_types(data, filename, fieldnames):
     logger.info(f"Writing data to {filename}")
     with open(filename, "w", newline='', encoding='utf-8') as f:
@@ -67,13 +98,17 @@ def write_csv_with_types(data, filename, fieldnames):
             writer.writerow(string_row)
     logger.info(f"Completed writing to {filename}")
 
+def data_path(name):
+    # Customers and events live in <name>.csv or <name>.rec depending on DATA_FORMAT
+    return f"{name}{records.EXTENSION}" if config.DATA_FORMAT == "records" else f"{name}.csv"
+
+def write_dataset(data, filename, fieldnames):
+    if filename.endswith(records.EXTENSION):
+        records.write_records(data, filename, fieldnames)
+    else:
+        write_csv_with_types(data, filename, fieldnames)
+    row_index.build_index(filename)
+
 def get_tenant_schema(base_url, tenant_id):
-    url = f"{base_url}/api/tenants/{tenant_id}/info"
-    logger.info(f"Fetching tenant schema from {url}")
-    response = requests.get(url)
-    config.handle_curl_debug("GET", url, headers=None, data=None, response=response)
-    if not response.ok:
-        logger.error(f"Failed to fetch tenant schema: {response.status_code} {response.text}")
-        raise Exception(f"Failed to fetch tenant schema: {response.status_code} {response.text}")
-    data = response.json()
+    data = schema_cache.fetch_tenant_info(base_url, tenant_id)
     return data.get("customerFields", []), data.get("eventFields", []), data.get("productFields", [])
\ No newline at end of file
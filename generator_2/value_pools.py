@@ -0,0 +1,57 @@
+import json
+import os
+import random
+from faker import Faker
+import config
+from utils import fake
+
+logger = config.logger
+
+_pools = {}
+
+
+def build_pool(kind, size):
+    # Pools come from their own seeded Faker so every process and every run builds the same pool
+    pool_fake = Faker()
+    pool_fake.seed_instance(f"{config.VALUE_POOL_SEED}:{kind}")
+    make_value = getattr(pool_fake, kind)
+    return [make_value() for _ in range(size)]
+
+
+def pool_file(kind, size):
+    return os.path.join(config.VALUE_POOL_DIR, f"{kind}-{size}-{config.VALUE_POOL_SEED}.json")
+
+
+def load_pool(kind):
+    size = config.VALUE_POOL_SIZE
+    path = pool_file(kind, size) if config.VALUE_POOL_DIR else None
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    logger.info(f"Building {kind} value pool of {size} values")
+    pool = build_pool(kind, size)
+    if path:
+        os.makedirs(config.VALUE_POOL_DIR, exist_ok=True)
+        # Write then rename, so generation processes racing on the same pool never read a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(pool, f)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved {kind} value pool to {path}")
+    return pool
+
+
+def get_pool(kind):
+    pool = _pools.get(kind)
+    if pool is None:
+        pool = _pools[kind] = load_pool(kind)
+    return pool
+
+
+def pooled(kind):
+    if not config.VALUE_POOLS_ENABLED:
+        return getattr(fake, kind)()
+    pool = _pools.get(kind) or get_pool(kind)
+    return random.choice(pool)
+